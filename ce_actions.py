@@ -1,32 +1,73 @@
-import subprocess
 import logging
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-import pytesseract
-import win32com.client as win32
-import easyocr
 from ce_config import load_general_config
-from sklearn.cluster import DBSCAN
+from ce_templates import TEMPLATES, FEATURES, RESOURCES_DIR
+from ce_hints import HINTS
+from ce_screens import SCREENS, UNKNOWN_SCREEN
+from ce_debug_images import DEBUG_IMAGES
+from ce_notify import NOTIFIER, EXIT_TIMEOUT as NOTIFY_EXIT_TIMEOUT
+import ce_adb
+from ce_adb import get_shell, AdbError, AdbShellError, AdbShellUnconfirmed
+import ce_backends
+from ce_ocr_service import OCR_SERVICE, OCR_SERVICE_ENABLED, OcrServiceError
+from ce_ocr import TESSERACT, TESSERACT_CONFIG, OCR_CACHE, OCR_CACHE_ENABLED, get_profile as get_ocr_profile
 
 TEMP_DIR = "temp"
-RESOURCES_DIR = "resources"
 
 general_config = load_general_config()
 SAVE_DEBUG_IMAGES = general_config.get('save_debug_images', False)
-
-if general_config.get('tesseract_path'):
-    pytesseract.pytesseract.tesseract_cmd = general_config['tesseract_path']
+SCREENSHOT_MODE = general_config.get('screenshot_mode', 'exec-out')
+FRAME_CACHE_ENABLED = general_config.get('frame_cache', True)
+FRAME_CACHE_MAX_AGE = general_config.get('frame_cache_max_age', 2.0)
+FEATURE_MATCHER = general_config.get('feature_matcher', 'bf')
+PYRAMID_MATCHING = general_config.get('pyramid_matching', False)
+PYRAMID_SCALE = general_config.get('pyramid_scale', 0.5)
+SETTLE_AFTER_INPUT = general_config.get('settle_after_input', False)
+SETTLE_THRESHOLD = general_config.get('settle_threshold', 2.0)
+SETTLE_MIN_WAIT = general_config.get('settle_min_wait', 0.3)
+SETTLE_MAX_WAIT = general_config.get('settle_max_wait', 3.0)
+FIXED_INPUT_PAUSE = 1.0 # seconds to wait after an input when settle_after_input is off
+WAIT_POLL_INTERVAL = general_config.get('wait_poll_interval', 1.0)
+MATCH_WORKERS = general_config.get('match_workers', 4)
+LOCATION_HINTS = general_config.get('location_hints', True)
+LOCATION_HINT_PADDING = general_config.get('location_hint_padding', 40)
+PERSISTENT_SHELL = general_config.get('persistent_shell', True)
+TAP_BATCH_INTERVAL = general_config.get('tap_batch_interval', 1.0)
+# Candidates from the downscaled pass are kept if they score within this margin of the threshold
+PYRAMID_MARGIN = 0.15
+# With 'auto', FLANN (LSH) is used once template x screen descriptor pairs exceed this count; below it brute force is faster
+FLANN_MIN_PAIRS = 1_000_000
+# ORB keypoint budget for a full screenshot; smaller search regions get a share proportional to their area
+FEATURE_BUDGET = 5000
+MIN_FEATURE_BUDGET = 500
+# ORB ignores a border of ~31px, so feature search regions are padded at least this much
+ORB_BORDER = 32
 
 EASYOCR_READERS = {}
+MATCH_POOL = None
+# Last classified frame per device, so repeated current_screen() calls on the same frame are free
+SCREEN_RESULTS = {}
+
+# Per-device frame cache. A device's "frame epoch" is bumped by every input action (click, scroll,
+# delay), so detections that run in the same epoch can share one decoded screenshot.
+FRAME_CACHE = {}
+FRAME_EPOCHS = {}
+FRAME_CACHE_STATS = {'hits': 0, 'misses': 0}
+_frame_cache_lock = threading.Lock()
+
+SETTLE_STATS = {'count': 0, 'total_time': 0.0, 'max_time': 0.0, 'timeouts': 0}
 
 def initialize_easyocr(lang_code='en'):
     global EASYOCR_READERS
     if lang_code not in EASYOCR_READERS:
         logging.info(f"Initializing EasyOCR for language: '{lang_code}'...")
         try:
-            EASYOCR_READERS[lang_code] = easyocr.Reader([lang_code])
+            EASYOCR_READERS[lang_code] = ce_backends.get('easyocr').Reader([lang_code])
             logging.info(f"EasyOCR for '{lang_code}' initialized.")
         except Exception as e:
             logging.error(f"Failed to initialize EasyOCR for '{lang_code}': {e}"); EASYOCR_READERS[lang_code] = None
@@ -36,20 +77,200 @@ def take_screenshot(adb_id):
     device_path = "/sdcard/screen.png"
     local_path = os.path.join(TEMP_DIR, f"screenshot_{adb_id.replace(':', '_')}.png")
     try:
-        subprocess.run(f"adb -s {adb_id} shell screencap -p {device_path}", check=True, shell=True, capture_output=True)
-        subprocess.run(f"adb -s {adb_id} pull {device_path} {local_path}", check=True, shell=True, capture_output=True)
-        subprocess.run(f"adb -s {adb_id} shell rm {device_path}", shell=True, capture_output=True)
-        logging.debug("Screenshot taken. Pausing for 1 second.")
-        time.sleep(1)
+        ce_adb.shell(adb_id, f"screencap -p {device_path}")
+        ce_adb.pull(adb_id, device_path, local_path)
+        ce_adb.shell(adb_id, f"rm {device_path}")
+        if not SETTLE_AFTER_INPUT:
+            logging.debug("Screenshot taken. Pausing for 1 second.")
+            time.sleep(1)
         return local_path
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to take screenshot on {adb_id}: {e.stderr.decode()}"); return None
+    except (OSError, AdbError) as e:
+        logging.error(f"Failed to take screenshot on {adb_id}: {e}"); return None
+
+def _raw_screencap_rgba(data):
+    """
+    Returns the RGBA pixels of the output of 'screencap' without '-p': a little-endian header of width,
+    height and pixel format (plus a colour space field on Android 9+), followed by RGBA pixels.
+    Returns None if the data is not in that format.
+    """
+    if len(data) < 12: return None
+    width, height = np.frombuffer(data[:8], dtype='<u4')
+    pixel_bytes = int(width) * int(height) * 4
+    header_size = len(data) - pixel_bytes
+    if header_size not in (12, 16): return None
+    return np.frombuffer(data, dtype=np.uint8, count=pixel_bytes, offset=header_size).reshape(int(height), int(width), 4)
+
+def _decode_raw_screencap(data):
+    """Decodes the output of 'screencap' without '-p' into a BGR image, or returns None."""
+    rgba = _raw_screencap_rgba(data)
+    return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR) if rgba is not None else None
+
+def capture_screen(adb_id):
+    """
+    Captures the current screen straight into memory and returns it as a BGR numpy array.
+    Uses 'adb exec-out screencap' so no file is written on the device or the host.
+    Falls back to take_screenshot() when the streaming capture fails or screenshot_mode = file.
+    Returns None on failure.
+    """
+    if SCREENSHOT_MODE in ('exec-out', 'raw'):
+        png_flag = "" if SCREENSHOT_MODE == 'raw' else " -p"
+        try:
+            data = ce_adb.exec_out(adb_id, f"screencap{png_flag}", timeout=15)
+            if SCREENSHOT_MODE == 'raw':
+                screen_img = _decode_raw_screencap(data)
+            else:
+                screen_img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if screen_img is not None:
+                logging.debug(f"Screen captured in memory via exec-out ({SCREENSHOT_MODE}).")
+                return screen_img
+            logging.warning(f"Could not decode in-memory screenshot from {adb_id}. Falling back to file capture.")
+        except AdbError as e:
+            logging.warning(f"In-memory screenshot failed on {adb_id}: {e}. Falling back to file capture.")
+    screenshot_path = take_screenshot(adb_id)
+    if not screenshot_path: return None
+    return cv2.imread(screenshot_path)
+
+def invalidate_frame(adb_id):
+    """Bumps the frame epoch of a device so the next detection captures a fresh screenshot."""
+    with _frame_cache_lock:
+        FRAME_EPOCHS[adb_id] = FRAME_EPOCHS.get(adb_id, 0) + 1
+        FRAME_CACHE.pop(adb_id, None)
+
+def get_frame(adb_id):
+    """
+    Returns the current screen as a (color, grayscale) pair of numpy arrays, or (None, None) on failure.
+    The decoded frame is reused by every detection in the same frame epoch, as long as it is
+    not older than frame_cache_max_age seconds (0 = no age limit). The arrays are read-only;
+    copy them before drawing on them.
+    """
+    with _frame_cache_lock:
+        epoch = FRAME_EPOCHS.get(adb_id, 0)
+        cached = FRAME_CACHE.get(adb_id) if FRAME_CACHE_ENABLED else None
+    if cached and cached['epoch'] == epoch:
+        age = time.monotonic() - cached['captured_at']
+        if not FRAME_CACHE_MAX_AGE or age <= FRAME_CACHE_MAX_AGE:
+            FRAME_CACHE_STATS['hits'] += 1
+            logging.debug(f"Reusing cached frame for {adb_id} (epoch {epoch}, age {age:.2f}s). Cache stats: {FRAME_CACHE_STATS}")
+            return cached['color'], cached['gray']
+    FRAME_CACHE_STATS['misses'] += 1
+    color = capture_screen(adb_id)
+    if color is None: return None, None
+    return _store_frame(adb_id, epoch, color)
+
+def _store_frame(adb_id, epoch, color, gray=None):
+    """Makes a captured frame read-only and caches it for the given epoch. Returns (color, gray)."""
+    if gray is None: gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+    color.flags.writeable = False
+    gray.flags.writeable = False
+    if FRAME_CACHE_ENABLED:
+        with _frame_cache_lock:
+            # Only store the frame if no input action happened while it was being captured
+            if FRAME_EPOCHS.get(adb_id, 0) == epoch:
+                FRAME_CACHE[adb_id] = {'epoch': epoch, 'captured_at': time.monotonic(), 'color': color, 'gray': gray}
+    return color, gray
+
+def _capture_settle_frame(adb_id):
+    """
+    Captures a frame for the settle check. Returns (rgba, bgr): the RGBA pixels of an uncompressed
+    'screencap', which skips the PNG encoding on the device and the decoding here, or (None, bgr)
+    from capture_screen() if the raw capture is not available. Returns (None, None) on failure.
+    """
+    if SCREENSHOT_MODE != 'file':
+        try:
+            rgba = _raw_screencap_rgba(ce_adb.exec_out(adb_id, "screencap", timeout=15))
+            if rgba is not None: return rgba, None
+            logging.debug(f"Unexpected raw screencap format on {adb_id}. Using a regular screenshot for the settle check.")
+        except AdbError as e:
+            logging.debug(f"Raw screencap failed on {adb_id}: {e}. Using a regular screenshot for the settle check.")
+    return None, capture_screen(adb_id)
+
+def wait_for_screen_to_settle(adb_id):
+    """
+    Captures frames after an input until two consecutive frames differ by less than settle_threshold
+    (mean absolute difference of 1/8-size grayscale thumbnails), or until settle_max_wait seconds have passed.
+    Frames are captured uncompressed, so a check costs about as much as transferring the pixels.
+    The last frame is put in the frame cache, so the next detection does not need a new screenshot.
+    Returns the time it took in seconds.
+    """
+    start = time.monotonic()
+    time.sleep(SETTLE_MIN_WAIT)
+    with _frame_cache_lock:
+        epoch = FRAME_EPOCHS.get(adb_id, 0)
+    previous_thumb, settled, frames = None, False, 0
+    while True:
+        rgba, color = _capture_settle_frame(adb_id)
+        if rgba is None and color is None: break
+        frames += 1
+        gray = cv2.cvtColor(rgba, cv2.COLOR_RGBA2GRAY) if rgba is not None else cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, None, fx=0.125, fy=0.125, interpolation=cv2.INTER_AREA)
+        if previous_thumb is not None and cv2.absdiff(thumb, previous_thumb).mean() < SETTLE_THRESHOLD:
+            settled = True
+            # Only the frame that is kept is converted to color
+            _store_frame(adb_id, epoch, color if color is not None else cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR), gray)
+            break
+        if time.monotonic() - start >= SETTLE_MAX_WAIT: break
+        previous_thumb = thumb
+    elapsed = time.monotonic() - start
+    SETTLE_STATS['count'] += 1
+    SETTLE_STATS['total_time'] += elapsed
+    SETTLE_STATS['max_time'] = max(SETTLE_STATS['max_time'], elapsed)
+    if not settled: SETTLE_STATS['timeouts'] += 1
+    logging.debug(f"Screen {'settled' if settled else 'did not settle'} after {elapsed:.2f}s on {adb_id} "
+                  f"({frames} frames; fixed pause is {FIXED_INPUT_PAUSE:g}s).")
+    return elapsed
+
+def settle_summary():
+    """Returns a one-line summary of the settle times measured so far, compared with the fixed pause."""
+    count = SETTLE_STATS['count']
+    if not count: return "no settle waits recorded"
+    saved = FIXED_INPUT_PAUSE * count - SETTLE_STATS['total_time']
+    return (f"{count} waits, average {SETTLE_STATS['total_time'] / count:.2f}s (fixed pause {FIXED_INPUT_PAUSE:g}s), "
+            f"longest {SETTLE_STATS['max_time']:.2f}s, {SETTLE_STATS['timeouts']} hit the {SETTLE_MAX_WAIT}s limit, "
+            f"{'saved' if saved >= 0 else 'lost'} {abs(saved):.1f}s in total")
+
+def _pause_after_input(adb_id, action):
+    """Gives the game time to react to an input: waits for the screen to settle, or for a fixed 1 second."""
+    if SETTLE_AFTER_INPUT:
+        wait_for_screen_to_settle(adb_id)
+    else:
+        logging.debug(f"{action} sent. Pausing for {FIXED_INPUT_PAUSE:g} second.")
+        time.sleep(FIXED_INPUT_PAUSE)
+
+def _send_input(adb_id, commands, timeout=30):
+    """Runs input commands on the device through its persistent shell, or a one-off shell command as a fallback."""
+    if PERSISTENT_SHELL:
+        try:
+            get_shell(adb_id).run(commands, timeout)
+            return
+        except AdbShellUnconfirmed as e:
+            # The input may already have been delivered, so it is not sent a second time
+            logging.warning(f"{e} The input may not have been delivered.")
+            return
+        except (OSError, AdbShellError) as e:
+            logging.warning(f"Persistent ADB shell unavailable on {adb_id}: {e}. Sending input with a one-off shell command.")
+    try:
+        ce_adb.shell(adb_id, commands, timeout)
+    except AdbError as e:
+        logging.error(f"Failed to send input to {adb_id}: {e}")
 
 def click(adb_id, x, y):
     logging.info(f"Clicking at ({x}, {y}) on {adb_id}")
-    subprocess.run(f"adb -s {adb_id} shell input tap {x} {y}", shell=True)
-    logging.debug("Click sent. Pausing for 1 second.")
-    time.sleep(1)
+    _send_input(adb_id, f"input tap {x} {y}")
+    invalidate_frame(adb_id)
+    _pause_after_input(adb_id, "Click")
+
+def click_many(adb_id, points):
+    """
+    Sends a run of taps to the device in one batch. The device waits tap_batch_interval seconds
+    between two taps, which replaces the pause the host would otherwise make after each click.
+    """
+    if len(points) == 1:
+        click(adb_id, *points[0]); return
+    logging.info(f"Clicking {len(points)} points {points} on {adb_id}")
+    commands = f"; sleep {TAP_BATCH_INTERVAL}; ".join(f"input tap {x} {y}" for x, y in points)
+    _send_input(adb_id, commands, timeout=30 + len(points) * TAP_BATCH_INTERVAL)
+    invalidate_frame(adb_id)
+    _pause_after_input(adb_id, "Click batch")
 
 def scroll(adb_id, x, y, direction, distance):
     logging.info(f"Scrolling {direction} by {distance}px from ({x}, {y}) on {adb_id}")
@@ -59,19 +280,16 @@ def scroll(adb_id, x, y, direction, distance):
     elif direction == 'up': y2 = y - distance
     elif direction == 'down': y2 = y + distance
     duration_ms = 300
-    subprocess.run(f"adb -s {adb_id} shell input swipe {x} {y} {x2} {y2} {duration_ms}", shell=True)
-    logging.debug("Scroll sent. Pausing for 1 second.")
-    time.sleep(1)
+    _send_input(adb_id, f"input swipe {x} {y} {x2} {y2} {duration_ms}")
+    invalidate_frame(adb_id)
+    _pause_after_input(adb_id, "Scroll")
 
 def compare_with_image(adb_id, language, instance_name, workflow_name, x, y, w, h, image_name, threshold=0.85):
     logging.debug(f"Comparing screen region ({x},{y},{w},{h}) with image '{image_name}' at threshold {threshold}")
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return False
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path): logging.error(f"Template image not found: {template_path}"); return False
-    screen_img = cv2.imread(screenshot_path)
-    template_img = cv2.imread(template_path)
-    if screen_img is None or template_img is None: logging.error("Could not read screenshot or template image."); return False
+    screen_img, _ = get_frame(adb_id)
+    if screen_img is None: return False
+    template_img = TEMPLATES.get(language, image_name)
+    if template_img is None: logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}"); return False
     region = screen_img[y:y+h, x:x+w]
     template_h, template_w, _ = template_img.shape
     region_h, region_w, _ = region.shape
@@ -80,37 +298,52 @@ def compare_with_image(adb_id, language, instance_name, workflow_name, x, y, w,
         return False
     if SAVE_DEBUG_IMAGES:
         filename = f"{instance_name}_{workflow_name}_compare_image_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), region)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), region)
     res = cv2.matchTemplate(region, template_img, cv2.TM_CCOEFF_NORMED)
     _, max_val, _, _ = cv2.minMaxLoc(res)
     logging.debug(f"Image match score: {max_val:.2f} (Threshold: {threshold})")
     return max_val >= threshold
 
-def compare_with_text(adb_id, language, instance_name, workflow_name,  x, y, w, h, expected_text):
-    logging.debug(f"Comparing screen region ({x},{y},{w},{h}) with text '{expected_text}' using Tesseract.")
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return False
-    screen_img = cv2.imread(screenshot_path)
-    if screen_img is None: logging.error("Could not read screenshot."); return False
+def current_screen(adb_id, language):
+    """
+    Returns the name of the screen that is shown, as named by the reference screenshots in
+    resources/<language>/screens/, or 'unknown' if it looks like none of them or the screen
+    cannot be captured.
+    """
+    _, screen_img = get_frame(adb_id)
+    if screen_img is None:
+        logging.warning(f"Could not capture the screen of {adb_id}. Current screen is '{UNKNOWN_SCREEN}'.")
+        return UNKNOWN_SCREEN
+    cached = SCREEN_RESULTS.get(adb_id)
+    if cached and cached[0] is screen_img: return cached[1]
+    start = time.perf_counter()
+    name, score = SCREENS.classify(language, screen_img)
+    SCREEN_RESULTS[adb_id] = (screen_img, name)
+    logging.debug(f"Current screen: '{name}' (similarity {score:.3f}) in {(time.perf_counter() - start) * 1e6:.0f} us.")
+    return name
+
+def compare_with_text(adb_id, language, instance_name, workflow_name,  x, y, w, h, expected_text, profile=None):
+    ocr_profile = get_ocr_profile(profile)
+    logging.debug(f"Comparing screen region ({x},{y},{w},{h}) with text '{expected_text}' using Tesseract (profile '{ocr_profile.name}').")
+    screen_img, _ = get_frame(adb_id)
+    if screen_img is None: return False
     region = screen_img[y:y+h, x:x+w]
     if SAVE_DEBUG_IMAGES:
         filename_input = f"{instance_name}_{workflow_name}_tesseract_input_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename_input), region)
-    scale_factor = 3
-    resized = cv2.resize(region, (int(region.shape[1] * scale_factor), int(region.shape[0] * scale_factor)), interpolation=cv2.INTER_LANCZOS4)
-    gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    contrast_enhanced = clahe.apply(gray)
-    _, thresh = cv2.threshold(contrast_enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    kernel = np.ones((2,2), np.uint8)
-    processed_image = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename_input), region)
+    cache_key = OCR_CACHE.key(region, f"tesseract-{TESSERACT.active_engine()}|{TESSERACT_CONFIG}|{ocr_profile.describe()}") if OCR_CACHE_ENABLED else None
+    ocr_text = OCR_CACHE.get(cache_key) if cache_key else None
+    if ocr_text is not None:
+        logging.debug(f"Tesseract result for region ({x},{y},{w},{h}) taken from the OCR cache: '{ocr_text}'")
+        return expected_text.lower() in ocr_text.lower()
+    processed_image = ocr_profile.preprocess(region)
     if SAVE_DEBUG_IMAGES:
         filename_processed = f"{instance_name}_{workflow_name}_tesseract_processed_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename_processed), processed_image)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename_processed), processed_image)
     try:
-        custom_config = r'--oem 1 --psm 7'
-        ocr_text = pytesseract.image_to_string(processed_image, config=custom_config).strip()
+        ocr_text = TESSERACT.read(processed_image, ocr_profile.name)
         logging.debug(f"Tesseract detected text: '{ocr_text}'")
+        if cache_key: OCR_CACHE.put(cache_key, ocr_text)
         return expected_text.lower() in ocr_text.lower()
     except Exception as e:
         logging.error(f"An error occurred during Tesseract OCR: {e}"); return False
@@ -118,23 +351,19 @@ def compare_with_text(adb_id, language, instance_name, workflow_name,  x, y, w,
 def compare_with_any_image(adb_id, language, instance_name, workflow_name, x, y, w, h, image_names, min_match_count=10):
     logging.debug(f"Feature-matching screen region ({x},{y},{w},{h}) with ANY of images: {image_names}")
     orb = cv2.ORB_create()
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return False
-    screen_img = cv2.imread(screenshot_path, cv2.IMREAD_GRAYSCALE)
-    if screen_img is None: logging.error("Could not read screenshot."); return False
+    _, screen_img = get_frame(adb_id)
+    if screen_img is None: return False
     region_of_interest = screen_img[y:y+h, x:x+w]
     if SAVE_DEBUG_IMAGES:
         filename = f"{instance_name}_{workflow_name}_compare_any_image_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), region_of_interest)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), region_of_interest)
     keypoints_roi, descriptors_roi = orb.detectAndCompute(region_of_interest, None)
     if descriptors_roi is None: logging.debug("No features found in screen region to compare against."); return False
     bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
     for image_name in image_names:
-        template_path = os.path.join(RESOURCES_DIR, language, image_name)
-        if not os.path.exists(template_path): logging.warning(f"Template image not found, skipping: {template_path}"); continue
-        template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-        if template_img is None: logging.warning(f"Could not read template image, skipping: {template_path}"); continue
-        keypoints_template, descriptors_template = orb.detectAndCompute(template_img, None)
+        template_features = FEATURES.get(language, image_name)
+        if template_features is None: logging.warning(f"Template image not found or unreadable, skipping: {TEMPLATES.path(language, image_name)}"); continue
+        _, descriptors_template = template_features
         if descriptors_template is None: logging.warning(f"No features in template '{image_name}', skipping."); continue
         matches = bf.match(descriptors_template, descriptors_roi)
         logging.debug(f"Found {len(matches)} feature matches for '{image_name}'. Required: {min_match_count}.")
@@ -147,20 +376,16 @@ def compare_with_any_image(adb_id, language, instance_name, workflow_name, x, y,
 def compare_with_features(adb_id, language, instance_name, workflow_name, x, y, w, h, image_name, min_match_count=10):
     logging.debug(f"Comparing screen region ({x},{y},{w},{h}) with image '{image_name}' using feature matching.")
     orb = cv2.ORB_create()
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path): logging.error(f"Template image not found: {template_path}"); return False
-    template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-    if template_img is None: logging.error(f"Could not read template image: {template_path}"); return False
-    keypoints_template, descriptors_template = orb.detectAndCompute(template_img, None)
+    template_features = FEATURES.get(language, image_name)
+    if template_features is None: logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}"); return False
+    _, descriptors_template = template_features
     if descriptors_template is None: logging.error(f"Could not find any features in template image '{image_name}'."); return False
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return False
-    screen_img = cv2.imread(screenshot_path, cv2.IMREAD_GRAYSCALE)
-    if screen_img is None: logging.error("Could not read screenshot."); return False
+    _, screen_img = get_frame(adb_id)
+    if screen_img is None: return False
     region_of_interest = screen_img[y:y+h, x:x+w]
     if SAVE_DEBUG_IMAGES:
         filename = f"{instance_name}_{workflow_name}_compare_features_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), region_of_interest)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), region_of_interest)
     keypoints_roi, descriptors_roi = orb.detectAndCompute(region_of_interest, None)
     if descriptors_roi is None: logging.debug("No features found in the screen region."); return False
     bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
@@ -174,21 +399,41 @@ def compare_with_features(adb_id, language, instance_name, workflow_name, x, y,
         logging.info(f"FAILURE: Not enough feature matches for '{image_name}'.")
         return False
 
-def compare_with_text_easyocr(adb_id, language, instance_name, workflow_name, x, y, w, h, expected_text):
+def _easyocr_readtext(language, image):
+    """
+    Runs EasyOCR on an image: in the shared OCR service if ocr_service is enabled, otherwise (or if the
+    service fails) with a reader in this process. Returns the EasyOCR results, or None if no reader is available.
+    """
+    if OCR_SERVICE_ENABLED:
+        try:
+            return OCR_SERVICE.readtext(language, image)
+        except OcrServiceError as e:
+            logging.warning(f"{e} Running EasyOCR in this process instead.")
     reader = initialize_easyocr(language)
-    if reader is None: logging.error(f"EasyOCR reader for '{language}' could not be initialized."); return False
+    if reader is None: return None
+    return reader.readtext(image)
+
+def compare_with_text_easyocr(adb_id, language, instance_name, workflow_name, x, y, w, h, expected_text):
+    if not OCR_SERVICE_ENABLED:
+        reader = initialize_easyocr(language)
+        if reader is None: logging.error(f"EasyOCR reader for '{language}' could not be initialized."); return False
     logging.debug(f"Comparing screen region ({x},{y},{w},{h}) with text '{expected_text}' using EasyOCR ({language}).")
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return False
-    screen_img = cv2.imread(screenshot_path)
-    if screen_img is None: logging.error("Could not read screenshot."); return False
+    screen_img, _ = get_frame(adb_id)
+    if screen_img is None: return False
     region = screen_img[y:y+h, x:x+w]
     if SAVE_DEBUG_IMAGES:
         filename = f"{instance_name}_{workflow_name}_compare_easyocr_({x},{y},{w},{h}).png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), region)
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), region)
     try:
-        results = reader.readtext(region)
-        detected_texts = [text for (bbox, text, prob) in results]
+        cache_key = OCR_CACHE.key(region, f"easyocr|{language}") if OCR_CACHE_ENABLED else None
+        detected_texts = OCR_CACHE.get(cache_key) if cache_key else None
+        if detected_texts is not None:
+            logging.debug(f"EasyOCR result for region ({x},{y},{w},{h}) taken from the OCR cache.")
+        else:
+            results = _easyocr_readtext(language, region)
+            if results is None: logging.error(f"EasyOCR reader for '{language}' could not be initialized."); return False
+            detected_texts = [text for (bbox, text, prob) in results]
+            if cache_key: OCR_CACHE.put(cache_key, detected_texts)
         for text in detected_texts:
             logging.debug(f"EasyOCR ({language}) detected: '{text}'")
             if expected_text.lower() in text.lower():
@@ -199,38 +444,91 @@ def compare_with_text_easyocr(adb_id, language, instance_name, workflow_name, x,
     except Exception as e:
         logging.error(f"An error occurred during EasyOCR processing: {e}"); return False
 
-def get_coords_from_image(adb_id, language, instance_name, workflow_name, image_name, threshold=0.85):
+def _match_template(screen_img, template_img, threshold, pyramid=None):
+    """
+    Runs TM_CCOEFF_NORMED template matching and returns the full-size response map.
+    With pyramid matching, a downscaled pass finds candidate locations and only small windows around
+    them are matched at full resolution. Scores inside those windows are exact; everything else is -1.
+    pyramid=None uses the pyramid_matching setting from instances.ini.
+    """
+    if pyramid is None: pyramid = PYRAMID_MATCHING
+    template_h, template_w = template_img.shape[:2]
+    scale = PYRAMID_SCALE
+    # Tiny templates lose too much detail when downscaled, so they are always matched at full resolution
+    if not pyramid or min(template_h, template_w) * scale < 8:
+        return cv2.matchTemplate(screen_img, template_img, cv2.TM_CCOEFF_NORMED)
+
+    small_screen = cv2.resize(screen_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small_template = cv2.resize(template_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    coarse_res = cv2.matchTemplate(small_screen, small_template, cv2.TM_CCOEFF_NORMED)
+    candidates = (coarse_res >= threshold - PYRAMID_MARGIN).astype(np.uint8)
+    # Always refine the best coarse location, so the reported best score is a full-resolution one
+    _, _, _, coarse_max_loc = cv2.minMaxLoc(coarse_res)
+    candidates[coarse_max_loc[1], coarse_max_loc[0]] = 1
+
+    res_h, res_w = screen_img.shape[0] - template_h + 1, screen_img.shape[1] - template_w + 1
+    res = np.full((res_h, res_w), -1.0, dtype=np.float32)
+    pad = int(np.ceil(1 / scale)) + 2
+    count, _, stats, _ = cv2.connectedComponentsWithStats(candidates, connectivity=8)
+    for cx, cy, cw, ch, _ in stats[1:count]:
+        x0 = max(int(cx / scale) - pad, 0)
+        y0 = max(int(cy / scale) - pad, 0)
+        x1 = min(int((cx + cw) / scale) + pad, res_w)
+        y1 = min(int((cy + ch) / scale) + pad, res_h)
+        window = screen_img[y0:y1 + template_h - 1, x0:x1 + template_w - 1]
+        res[y0:y1, x0:x1] = cv2.matchTemplate(window, template_img, cv2.TM_CCOEFF_NORMED)
+    logging.debug(f"Pyramid match refined {count - 1} candidate window(s) at full resolution.")
+    return res
+
+def _hint_region(box, screen_shape, padding):
+    """Returns the (x0, y0, x1, y1) search region around a hinted (x, y, w, h) box, clipped to the screen."""
+    x, y, w, h = box
+    screen_h, screen_w = screen_shape[:2]
+    return max(x - padding, 0), max(y - padding, 0), min(x + w + padding, screen_w), min(y + h + padding, screen_h)
+
+def get_coords_from_image(adb_id, language, instance_name, workflow_name, image_name, threshold=0.85, pyramid=None):
     """
     Finds a template image on the screen and returns the coordinates of its center.
+    The region where the template was last found on this instance is searched first.
     Returns (x, y) tuple on success, or None on failure.
+    pyramid=True/False turns coarse-to-fine matching on or off for this call.
     """
     logging.debug(f"Searching for image '{image_name}' to get its coordinates.")
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path:
-        return None
-
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path):
-        logging.error(f"Template image not found: {template_path}")
-        return None
-
-    # Load the screenshot in color for drawing debug shapes
-    screen_img_color = cv2.imread(screenshot_path)
+    # The color frame is used for drawing debug shapes, the grayscale one for matching
+    screen_img_color, screen_img_gray = get_frame(adb_id)
     if screen_img_color is None:
-        logging.error("Could not read screenshot image file.")
         return None
-        
-    # Convert to grayscale for matching
-    screen_img_gray = cv2.cvtColor(screen_img_color, cv2.COLOR_BGR2GRAY)
-    template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
 
+    template_img = TEMPLATES.get(language, image_name, grayscale=True)
     if template_img is None:
-        logging.error("Could not read template image for coordinate finding.")
+        logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}")
         return None
 
+    return _find_template_on_frame(screen_img_color, screen_img_gray, template_img, instance_name, workflow_name, image_name, threshold, pyramid)
+
+def _find_template_on_frame(screen_img_color, screen_img_gray, template_img, instance_name, workflow_name, image_name, threshold, pyramid=None, log_miss=True):
+    """Locates one template on an already captured frame. Returns the (x, y) center or None."""
     template_h, template_w = template_img.shape
-    res = cv2.matchTemplate(screen_img_gray, template_img, cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+    max_val, max_loc = None, None
+
+    # Try the last known location first and only fall back to a full-screen search if it fails
+    hint = HINTS.lookup(instance_name, image_name) if LOCATION_HINTS else None
+    if hint:
+        x0, y0, x1, y1 = _hint_region(hint, screen_img_gray.shape, LOCATION_HINT_PADDING)
+        if y1 - y0 >= template_h and x1 - x0 >= template_w:
+            res = cv2.matchTemplate(screen_img_gray[y0:y1, x0:x1], template_img, cv2.TM_CCOEFF_NORMED)
+            _, hint_val, _, hint_loc = cv2.minMaxLoc(res)
+            if hint_val >= threshold:
+                max_val, max_loc = hint_val, (hint_loc[0] + x0, hint_loc[1] + y0)
+                HINTS.record_hit(instance_name, image_name, (max_loc[0], max_loc[1], template_w, template_h))
+        if max_val is None:
+            HINTS.record_miss(instance_name, image_name)
+
+    if max_val is None:
+        res = _match_template(screen_img_gray, template_img, threshold, pyramid)
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+        if max_val >= threshold and LOCATION_HINTS:
+            HINTS.update(instance_name, image_name, (max_loc[0], max_loc[1], template_w, template_h))
 
     logging.debug(f"Coordinate search for '{image_name}' match score: {max_val:.2f} (Threshold: {threshold})")
 
@@ -242,17 +540,17 @@ def get_coords_from_image(adb_id, language, instance_name, workflow_name, image_
         
         # Draw a green rectangle if it's a success, red if it's a failure
         color = (0, 255, 0) if max_val >= threshold else (0, 0, 255)
-        cv2.rectangle(screen_img_color, top_left, bottom_right, color, 2)
-        
-        # Put the match score text above the box
         score_text = f"Score: {max_val:.2f}"
-        cv2.putText(screen_img_color, score_text, (top_left[0], top_left[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        def draw(debug_img):
+            cv2.rectangle(debug_img, top_left, bottom_right, color, 2)
+            # Put the match score text above the box
+            cv2.putText(debug_img, score_text, (top_left[0], top_left[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
         
-        # Save the debug image
+        # Save the debug image (drawn and written by the debug image writer thread)
         image_name_safe = image_name.replace('.','_')
         filename = f"{instance_name}_{workflow_name}_{image_name_safe}.png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), screen_img_color)
-        logging.debug(f"Saved get_coords debug image to {filename}")
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), screen_img_color, draw)
+        logging.debug(f"Queued get_coords debug image {filename}")
     # --- END OF NEW BLOCK ---
 
     if max_val >= threshold:
@@ -261,57 +559,144 @@ def get_coords_from_image(adb_id, language, instance_name, workflow_name, image_
         logging.info(f"Found '{image_name}' at coordinates: ({center_x}, {center_y})")
         return (center_x, center_y)
     else:
-        logging.warning(f"Could not find image '{image_name}' on screen with sufficient confidence.")
+        if log_miss: logging.warning(f"Could not find image '{image_name}' on screen with sufficient confidence.")
         return None
 
-# Add this function to ce_actions.py
+def _match_pool():
+    """Returns the shared thread pool used for batched template matching. OpenCV releases the GIL while matching."""
+    global MATCH_POOL
+    if MATCH_POOL is None:
+        MATCH_POOL = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="match")
+    return MATCH_POOL
 
-def get_all_coords_from_image(adb_id, language, instance_name, workflow_name, image_name, threshold=0.85):
+def get_coords_from_images(adb_id, language, instance_name, workflow_name, image_names, threshold=0.85, pyramid=None, log_miss=True):
+    """
+    Looks for several template images on ONE screenshot, matching them in parallel.
+    'threshold' is either one value for all images or a list with one value per image.
+    Returns a dict of image name -> (x, y) center, or None for the images that were not found.
+    """
+    if isinstance(image_names, str): image_names = [image_names]
+    thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * len(image_names)
+    if len(thresholds) != len(image_names):
+        logging.error(f"get_coords_from_images got {len(image_names)} images but {len(thresholds)} thresholds."); return {name: None for name in image_names}
+    logging.debug(f"Searching one screenshot for images: {image_names}")
+    screen_img_color, screen_img_gray = get_frame(adb_id)
+    if screen_img_color is None:
+        return {name: None for name in image_names}
+
+    def find(image_name, image_threshold):
+        template_img = TEMPLATES.get(language, image_name, grayscale=True)
+        if template_img is None:
+            logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}")
+            return None
+        return _find_template_on_frame(screen_img_color, screen_img_gray, template_img, instance_name, workflow_name, image_name, image_threshold, pyramid, log_miss)
+
+    results = list(_match_pool().map(find, image_names, thresholds))
+    return dict(zip(image_names, results))
+
+def get_first_coords_from_images(adb_id, language, instance_name, workflow_name, image_names, threshold=0.85, pyramid=None):
+    """
+    Like get_coords_from_images, but returns only the first image in list order that was found,
+    as an (image_name, (x, y)) tuple. Returns None if none of the images are on the screen.
+    """
+    found = get_coords_from_images(adb_id, language, instance_name, workflow_name, image_names, threshold, pyramid)
+    for image_name, coords in found.items():
+        if coords:
+            logging.info(f"First match among {list(found)}: '{image_name}' at {coords}")
+            return (image_name, coords)
+    logging.info(f"None of the images {list(found)} were found on screen.")
+    return None
+
+def wait_for_any_image(adb_id, language, instance_name, workflow_name, image_names, timeout=30, interval=None, threshold=0.85):
+    """
+    Polls the screen until one of the template images appears, or until 'timeout' seconds have passed.
+    A fresh screenshot is taken every 'interval' seconds (default: wait_poll_interval from instances.ini).
+    Returns (image_name, (x, y)) for the first image in list order that was found, or None on timeout.
+    """
+    if isinstance(image_names, str): image_names = [image_names]
+    if interval is None: interval = WAIT_POLL_INTERVAL
+    logging.info(f"Waiting up to {timeout}s for any of {image_names}...")
+    start = time.monotonic()
+    attempts = 0
+    while True:
+        attempts += 1
+        invalidate_frame(adb_id) # Time has passed, so never reuse a cached frame while waiting
+        found = get_coords_from_images(adb_id, language, instance_name, workflow_name, image_names, threshold, log_miss=False)
+        elapsed = time.monotonic() - start
+        for image_name, coords in found.items():
+            if coords:
+                logging.info(f"'{image_name}' appeared after {elapsed:.1f}s ({attempts} checks).")
+                return (image_name, coords)
+        if elapsed + interval > timeout:
+            logging.warning(f"None of {image_names} appeared within {timeout}s ({attempts} checks).")
+            return None
+        time.sleep(interval)
+
+def wait_for_image(adb_id, language, instance_name, workflow_name, image_name, timeout=30, interval=None, threshold=0.85):
+    """
+    Polls the screen until the template image appears, or until 'timeout' seconds have passed.
+    Returns the (x, y) center of the image, or None on timeout.
+    """
+    found = wait_for_any_image(adb_id, language, instance_name, workflow_name, [image_name], timeout, interval, threshold)
+    return found[1] if found else None
+
+def _match_peaks(res, threshold, template_w, template_h):
+    """
+    Turns a template matching response map into one (x, y, w, h) rectangle per match.
+    Candidates are the local maxima of the response that reach the threshold. Greedy non-maximum
+    suppression, strongest first, drops candidates closer than a quarter of (w + h) to a kept match
+    in both x and y, the same grouping distance cv2.groupRectangles(eps=0.5) uses. Each kept match is
+    placed at the mean position of the passing pixels around it, as groupRectangles averages its group.
+    The cost does not depend on how many pixels pass the threshold.
+    """
+    delta = (template_w + template_h) * 0.25
+    reach = int(delta)
+    res = np.nan_to_num(res, nan=-1.0)
+    passing = (res >= threshold).astype(np.uint8)
+    peaks = (res >= cv2.dilate(res, np.ones((3, 3), np.uint8))) & (passing > 0)
+    # groupRectangles(groupThreshold=1) discards groups of a single rectangle, so a peak needs another passing pixel nearby
+    support = cv2.boxFilter(passing, cv2.CV_32F, (2 * reach + 1, 2 * reach + 1), normalize=False, borderType=cv2.BORDER_CONSTANT)
+    peak_y, peak_x = np.nonzero(peaks & (support >= 1.5))
+    if len(peak_x) == 0: return []
+    strongest_first = np.argsort(-res[peak_y, peak_x], kind='stable')
+    peak_x, peak_y = peak_x[strongest_first], peak_y[strongest_first]
+    suppressed = np.zeros(len(peak_x), dtype=bool)
+    rectangles = []
+    for i in range(len(peak_x)):
+        if suppressed[i]: continue
+        x, y = peak_x[i], peak_y[i]
+        suppressed |= (np.abs(peak_x - x) <= delta) & (np.abs(peak_y - y) <= delta)
+        x0, y0 = max(x - reach, 0), max(y - reach, 0)
+        window_y, window_x = np.nonzero(passing[y0:y + reach + 1, x0:x + reach + 1])
+        rectangles.append((int(np.rint(x0 + window_x.mean())), int(np.rint(y0 + window_y.mean())), template_w, template_h))
+    return rectangles
+
+def get_all_coords_from_image(adb_id, language, instance_name, workflow_name, image_name, threshold=0.85, pyramid=None):
     """
     Finds ALL occurrences of a template image on the screen that meet a threshold.
     Returns a list of (x, y) tuples. The list is empty if no matches are found.
     The list is sorted from top-to-bottom, then left-to-right.
+    pyramid=True/False turns coarse-to-fine matching on or off for this call.
     """
     logging.debug(f"Searching for ALL occurrences of image '{image_name}'.")
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path:
-        return []
-
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path):
-        logging.error(f"Template image not found: {template_path}")
+    # The color frame is used for drawing, but we'll match in grayscale
+    screen_img_color, screen_img = get_frame(adb_id)
+    if screen_img_color is None:
         return []
 
-    # Read images in color for drawing, but we'll match in grayscale
-    screen_img_color = cv2.imread(screenshot_path)
-    screen_img = cv2.cvtColor(screen_img_color, cv2.COLOR_BGR2GRAY)
-    template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-
-    if screen_img is None or template_img is None:
-        logging.error("Could not read screenshot or template image for coordinate finding.")
+    template_img = TEMPLATES.get(language, image_name, grayscale=True)
+    if template_img is None:
+        logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}")
         return []
 
     template_h, template_w = template_img.shape
-    res = cv2.matchTemplate(screen_img, template_img, cv2.TM_CCOEFF_NORMED)
-    
-    # Find all locations where the match score is above the threshold
-    locations = np.where(res >= threshold)
+    res = _match_template(screen_img, template_img, threshold, pyramid)
     
-    # Zip the locations into (x, y) pairs
-    points = list(zip(*locations[::-1])) # Switch from (row, col) to (x, y)
-    
-    if not points:
+    rectangles = _match_peaks(res, threshold, template_w, template_h)
+    if not rectangles:
         logging.info(f"No occurrences of '{image_name}' found with threshold >= {threshold}.")
         return []
 
-    # --- Non-Maximum Suppression ---
-    # Group overlapping rectangles together to find the true centers
-    rectangles, _ = cv2.groupRectangles(
-        [ (pt[0], pt[1], template_w, template_h) for pt in points ], 
-        groupThreshold=1, 
-        eps=0.5
-    )
-
     # Calculate the center of each unique, non-overlapping rectangle found
     centers = []
     for (x, y, w, h) in rectangles:
@@ -320,16 +705,18 @@ def get_all_coords_from_image(adb_id, language, instance_name, workflow_name, im
         center_x = int(x + w // 2)
         center_y = int(y + h // 2)
         centers.append((center_x, center_y))
-        if SAVE_DEBUG_IMAGES:
-             # Draw a rectangle on the color screenshot for debugging
-             cv2.rectangle(screen_img_color, (x, y), (x + w, y + h), (0, 255, 0), 2)
-             cv2.putText(screen_img_color, f"({center_x},{center_y})", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
     if SAVE_DEBUG_IMAGES and centers:
+        # The centers are sorted below, so the writer thread gets its own copy
+        def draw(debug_img, found=list(zip(rectangles, centers))):
+            for (x, y, w, h), (center_x, center_y) in found:
+                # Draw a rectangle on the color screenshot for debugging
+                cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.putText(debug_img, f"({center_x},{center_y})", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
         image_name_safe = image_name.replace('.','_')
         filename = f"{instance_name}_{workflow_name}_{image_name_safe}.png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), screen_img_color)
-        logging.debug(f"Saved debug image with all found matches to {filename}")
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), screen_img_color, draw)
+        logging.debug(f"Queued debug image with all found matches {filename}")
 
     # Sort the centers from top-to-bottom, then left-to-right for predictable order
     centers.sort(key=lambda p: (p[1], p[0]))
@@ -337,154 +724,253 @@ def get_all_coords_from_image(adb_id, language, instance_name, workflow_name, im
     logging.info(f"Found {len(centers)} occurrences of '{image_name}'. Coords: {centers}")
     return centers
 
-def get_coords_from_features(adb_id, language, instance_name, workflow_name, image_name, min_match_count=10):
+def _good_feature_matches(descriptors_template, descriptors_screen, ratio_thresh=0.8):
+    """
+    Runs a 2-nearest-neighbour match of template descriptors against screen descriptors and
+    returns the matches that pass Lowe's ratio test. Uses exact brute-force Hamming matching unless
+    feature_matcher in instances.ini opts in to the approximate FLANN LSH index ('flann' or 'auto').
+    """
+    use_flann = FEATURE_MATCHER == 'flann' or (FEATURE_MATCHER == 'auto' and len(descriptors_template) * len(descriptors_screen) >= FLANN_MIN_PAIRS)
+    if use_flann:
+        index_params = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1) # 6 = FLANN_INDEX_LSH
+        matcher = cv2.FlannBasedMatcher(index_params, dict(checks=50))
+    else:
+        matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+    all_matches = matcher.knnMatch(descriptors_template, descriptors_screen, k=2)
+    # Pairs with fewer than two neighbours cannot be ratio-tested and are skipped
+    return [pair[0] for pair in all_matches if len(pair) == 2 and pair[0].distance < ratio_thresh * pair[1].distance]
+
+def _feature_search_region(region, screen_shape):
+    """
+    Returns the (x0, y0, x1, y1) area to extract screen features from: the whole screen, or the
+    (x, y, w, h) region given by the workflow, padded for ORB's border and clipped to the screen.
+    """
+    screen_h, screen_w = screen_shape[:2]
+    if region is None: return 0, 0, screen_w, screen_h
+    try:
+        x, y, w, h = (int(v) for v in region)
+    except (TypeError, ValueError):
+        logging.error(f"Invalid feature search region {region}. Expected [x, y, w, h]. Searching the whole screen."); return 0, 0, screen_w, screen_h
+    if w <= 0 or h <= 0:
+        logging.error(f"Invalid feature search region {region}. Width and height must be positive. Searching the whole screen."); return 0, 0, screen_w, screen_h
+    return _hint_region((x, y, w, h), screen_shape, ORB_BORDER)
+
+def _feature_detector(area_shape, screen_shape):
+    """Returns an ORB detector whose keypoint budget is FEATURE_BUDGET scaled by the searched share of the screen."""
+    share = (area_shape[0] * area_shape[1]) / (screen_shape[0] * screen_shape[1])
+    return cv2.ORB_create(nfeatures=max(MIN_FEATURE_BUDGET, int(FEATURE_BUDGET * share)))
+
+def _detect_features(orb, image):
+    """Runs ORB on an image (or a region of it) and logs how long it took and for how many pixels."""
+    start = time.perf_counter()
+    keypoints, descriptors = orb.detectAndCompute(image, None)
+    logging.debug(f"ORB found {len(keypoints)} keypoints (budget {orb.getMaxFeatures()}) in a {image.shape[1]}x{image.shape[0]} area "
+                  f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return keypoints, descriptors
+
+def _locate_with_features(orb, screen_img, points_template, descriptors_template, template_shape, min_match_count):
+    """
+    Matches template features against a screen image (or a region of it) and returns
+    (corners, good_match_count), where corners are the template's projected corner points,
+    or None when there are not enough consistent matches.
+    """
+    keypoints_screen, descriptors_screen = _detect_features(orb, screen_img)
+    if descriptors_screen is None:
+        return None, 0
+
+    # --- IMPROVEMENT 2: Relax the ratio test slightly ---
+    # A value of 0.8 is less strict than 0.75 and can help with similar-looking images.
+    start = time.perf_counter()
+    good_matches = _good_feature_matches(descriptors_template, descriptors_screen, ratio_thresh=0.8)
+    logging.debug(f"Matched {len(descriptors_template)} template descriptors against {len(descriptors_screen)} screen descriptors "
+                  f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    if len(good_matches) < min_match_count:
+        return None, len(good_matches)
+
+    src_pts = np.float32([points_template[m.queryIdx] for m in good_matches]).reshape(-1, 1, 2)
+    dst_pts = np.float32([keypoints_screen[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    if M is None:
+        logging.warning("Could not compute homography matrix. Matches may be inconsistent.")
+        return None, len(good_matches)
+
+    h, w = template_shape
+    pts = np.float32([[0, 0], [0, h - 1], [w - 1, h - 1], [w - 1, 0]]).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(pts, M), len(good_matches)
+
+def get_coords_from_features(adb_id, language, instance_name, workflow_name, image_name, min_match_count=10, region=None):
     """
     Finds a template image on the screen using feature matching (ORB) and returns
     the coordinates of its center. Ideal for animated or slightly scaled/rotated elements.
+    The region where the template was last found on this instance is searched first.
+    region=[x, y, w, h] limits the search to that part of the screen. Features are then only extracted
+    there, with a keypoint budget proportional to its area.
     Returns (x, y) tuple on success, or None on failure.
     """
     logging.debug(f"Feature-searching for image '{image_name}' to get its coordinates.")
+    search_start = time.perf_counter()
     
     # 1. Load template and find its features
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path):
-        logging.error(f"Template image not found: {template_path}")
-        return None
-    
-    template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+    template_img = TEMPLATES.get(language, image_name, grayscale=True)
     if template_img is None:
-        logging.error(f"Could not read template image: {template_path}")
+        logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}")
         return None
 
     # --- IMPROVEMENT 1: Increase the number of features to detect ---
     # We look for more features to get a higher chance of a good match on small templates.
-    orb = cv2.ORB_create(nfeatures=5000) 
-    keypoints_template, descriptors_template = orb.detectAndCompute(template_img, None)
+    # The template side comes precomputed from the descriptor index.
+    points_template, descriptors_template = FEATURES.get(language, image_name, nfeatures=5000)
     
     if descriptors_template is None:
         logging.error(f"Could not find any features in template image '{image_name}'.")
         return None
 
-    # 2. Take screenshot and find its features
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return None
-    
-    screen_img = cv2.imread(screenshot_path, cv2.IMREAD_GRAYSCALE)
-    if screen_img is None:
-        logging.error("Could not read screenshot for feature matching.")
-        return None
-        
-    keypoints_screen, descriptors_screen = orb.detectAndCompute(screen_img, None)
-    
-    if descriptors_screen is None:
-        logging.warning("No features found on the screen to compare against.")
-        return None
-
-    # 3. Match features between template and screenshot
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    all_matches = bf.knnMatch(descriptors_template, descriptors_screen, k=2)
-
-    # Apply ratio test to find good matches
-    good_matches = []
-    try:
-        # --- IMPROVEMENT 2: Relax the ratio test slightly ---
-        # A value of 0.8 is less strict than 0.75 and can help with similar-looking images.
-        ratio_thresh = 0.8 
-        for m, n in all_matches:
-            if m.distance < ratio_thresh * n.distance:
-                good_matches.append(m)
-    except ValueError:
-        logging.debug("Not enough matches to perform ratio test. Likely no match.")
-        return None
+    # 2. Take screenshot
+    screen_img_color, screen_img = get_frame(adb_id)
+    if screen_img_color is None: return None
+    rx0, ry0, rx1, ry1 = _feature_search_region(region, screen_img.shape)
+
+    # 3. Try the last known location first. ORB ignores a border of ~31px, so the region is padded at least that much.
+    # The hinted area is limited to the search region, so a hint never finds a match outside it.
+    dst = None
+    hint = HINTS.lookup(instance_name, image_name) if LOCATION_HINTS else None
+    if hint:
+        x0, y0, x1, y1 = _hint_region(hint, screen_img.shape, max(LOCATION_HINT_PADDING, ORB_BORDER))
+        x0, y0, x1, y1 = max(x0, rx0), max(y0, ry0), min(x1, rx1), min(y1, ry1)
+        if x1 <= x0 or y1 <= y0:
+            logging.debug(f"Last known location of '{image_name}' is outside the search region. Skipping it.")
+            hint = None
+    if hint:
+        hint_area = screen_img[y0:y1, x0:x1]
+        dst, hint_matches = _locate_with_features(_feature_detector(hint_area.shape, screen_img.shape), hint_area, points_template, descriptors_template, template_img.shape, min_match_count)
+        if dst is not None:
+            dst = dst + np.float32([x0, y0])
+            logging.debug(f"Found {hint_matches} good feature matches in the hinted region ({x0},{y0},{x1 - x0},{y1 - y0}).")
+            HINTS.record_hit(instance_name, image_name, cv2.boundingRect(dst))
+        else:
+            HINTS.record_miss(instance_name, image_name)
+
+    # 4. Otherwise match features across the search region (the whole screenshot by default)
+    if dst is None:
+        search_area = screen_img[ry0:ry1, rx0:rx1]
+        dst, good_match_count = _locate_with_features(_feature_detector(search_area.shape, screen_img.shape), search_area, points_template, descriptors_template, template_img.shape, min_match_count)
+        logging.info(f"Found {good_match_count} good feature matches. Required: {min_match_count}.")
+        if dst is None:
+            logging.info(f"FAILURE: Not enough good feature matches for '{image_name}'.")
+            return None
+        dst = dst + np.float32([rx0, ry0])
+        if LOCATION_HINTS: HINTS.update(instance_name, image_name, cv2.boundingRect(dst))
+    logging.debug(f"Feature search for '{image_name}' took {(time.perf_counter() - search_start) * 1000:.1f} ms.")
 
-    logging.info(f"Found {len(good_matches)} good feature matches. Required: {min_match_count}.")
+    center_x = int(np.mean(dst[:, 0, 0]))
+    center_y = int(np.mean(dst[:, 0, 1]))
     
-    # 4. If enough matches are found, find the object's location
-    if len(good_matches) >= min_match_count:
-        src_pts = np.float32([keypoints_template[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([keypoints_screen[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        
-        M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-        
-        if M is None:
-            logging.warning("Could not compute homography matrix. Matches may be inconsistent.")
-            return None
-            
-        h, w = template_img.shape
-        pts = np.float32([[0, 0], [0, h - 1], [w - 1, h - 1], [w - 1, 0]]).reshape(-1, 1, 2)
-        dst = cv2.perspectiveTransform(pts, M)
-        
-        center_x = int(np.mean(dst[:, 0, 0]))
-        center_y = int(np.mean(dst[:, 0, 1]))
-        
-        logging.info(f"SUCCESS: Located '{image_name}' via features at center: ({center_x}, {center_y})")
-        
-        if SAVE_DEBUG_IMAGES:
-            debug_img = cv2.polylines(cv2.imread(screenshot_path), [np.int32(dst)], True, (0, 255, 0), 3, cv2.LINE_AA)
+    logging.info(f"SUCCESS: Located '{image_name}' via features at center: ({center_x}, {center_y})")
+    
+    if SAVE_DEBUG_IMAGES:
+        def draw(debug_img):
+            cv2.polylines(debug_img, [np.int32(dst)], True, (0, 255, 0), 3, cv2.LINE_AA)
             cv2.circle(debug_img, (center_x, center_y), 10, (0, 0, 255), -1)
-            # filename = f"DEBUG_feature_coords_{image_name.replace('.','_')}_{int(time.time())}.png"
-            filename = f"{instance_name}_{workflow_name}_feature_coords_{image_name.replace('.','_')}.png"
-            cv2.imwrite(os.path.join(TEMP_DIR, filename), debug_img)
-            logging.debug(f"Saved feature coordinate debug image to {filename}")
+        # filename = f"DEBUG_feature_coords_{image_name.replace('.','_')}_{int(time.time())}.png"
+        filename = f"{instance_name}_{workflow_name}_feature_coords_{image_name.replace('.','_')}.png"
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), screen_img_color, draw)
+        logging.debug(f"Queued feature coordinate debug image {filename}")
 
-        return (center_x, center_y)
-    else:
-        logging.info(f"FAILURE: Not enough good feature matches for '{image_name}'.")
-        return None
+    return (center_x, center_y)
 
-def get_all_coords_from_features(adb_id, language, instance_name, workflow_name, image_name, min_match_count=7, eps=50, min_samples=5):
+def _cluster_points(points, eps, min_samples, chunk_size=256):
+    """
+    Density-based clustering of 2D points with the same rules and labels as scikit-learn's DBSCAN:
+    points within eps of each other (the point itself included) are neighbours, a point with at least
+    min_samples neighbours is a core point, and clusters are the groups of core points connected through
+    neighbouring cores plus the non-core points next to them. Returns one label per point, -1 for noise.
+    Distances are computed with NumPy, chunk_size points at a time. The points are swept in x order,
+    so each chunk is only compared with the points whose x is within eps of it.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    eps_sq = float(eps) ** 2
+    order = np.argsort(points[:, 0], kind='stable')
+    x, y = points[order, 0], points[order, 1]
+    neighbours = [None] * n # Indices of the neighbours of each point, in the original order
+    counts = np.empty(n, dtype=np.intp)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        lo, hi = np.searchsorted(x, x[start] - eps, 'left'), np.searchsorted(x, x[end - 1] + eps, 'right')
+        within = (x[start:end, None] - x[lo:hi]) ** 2 + (y[start:end, None] - y[lo:hi]) ** 2 <= eps_sq
+        row_counts = within.sum(axis=1)
+        counts[order[start:end]] = row_counts
+        _, cols = np.nonzero(within)
+        for point, members in zip(order[start:end], np.split(order[lo + cols], np.cumsum(row_counts)[:-1])):
+            neighbours[point] = members
+    is_core = counts >= min_samples
+    labels = np.full(n, -1, dtype=np.intp)
+    label = 0
+    # Clusters are grown from core points in index order, so border points shared by two clusters get
+    # the first one, as in scikit-learn
+    for seed in np.flatnonzero(is_core):
+        if labels[seed] != -1: continue
+        labels[seed] = label
+        stack = [seed]
+        while stack:
+            members = neighbours[stack.pop()]
+            new = members[labels[members] == -1]
+            labels[new] = label
+            stack.extend(new[is_core[new]])
+        label += 1
+    return labels
+
+def _cluster_centers(points, labels):
+    """Returns the (x, y) center of every cluster, in label order. Noise points (label -1) are ignored."""
+    centers = []
+    for k in np.unique(labels):
+        if k == -1: continue
+        # Calculate the center of the cluster by averaging the coordinates
+        cluster_points = points[labels == k]
+        centers.append((int(np.mean(cluster_points[:, 0])), int(np.mean(cluster_points[:, 1]))))
+    return centers
+
+def get_all_coords_from_features(adb_id, language, instance_name, workflow_name, image_name, min_match_count=7, eps=50, min_samples=5, region=None):
     """
     Finds ALL occurrences of a template image on the screen using feature matching and clustering.
     Ideal for finding multiple instances of animated or scaled/rotated elements.
     Returns a list of (x, y) tuples, sorted top-to-bottom. Returns an empty list if none are found.
 
     - min_match_count: Minimum "good" feature matches required to even attempt clustering.
-    - eps: The maximum distance between two points for them to be considered as in the same neighborhood (DBSCAN parameter).
-    - min_samples: The number of samples in a neighborhood for a point to be considered as a core point (DBSCAN parameter).
+    - eps: The maximum distance between two points for them to be considered as in the same neighborhood (DBSCAN parameter, see _cluster_points).
+    - min_samples: The number of samples in a neighborhood for a point to be considered as a core point (DBSCAN parameter, see _cluster_points).
+    - region: Optional [x, y, w, h] part of the screen to search. Features are then only extracted there.
     """
     logging.debug(f"Feature-searching for ALL occurrences of image '{image_name}'.")
+    search_start = time.perf_counter()
 
     # 1. Load template and find its features
-    template_path = os.path.join(RESOURCES_DIR, language, image_name)
-    if not os.path.exists(template_path):
-        logging.error(f"Template image not found: {template_path}"); return []
-    template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+    template_img = TEMPLATES.get(language, image_name, grayscale=True)
     if template_img is None:
-        logging.error(f"Could not read template image: {template_path}"); return []
+        logging.error(f"Template image not found or unreadable: {TEMPLATES.path(language, image_name)}"); return []
 
-    orb = cv2.ORB_create(nfeatures=5000)
-    keypoints_template, descriptors_template = orb.detectAndCompute(template_img, None)
+    _, descriptors_template = FEATURES.get(language, image_name, nfeatures=5000)
     if descriptors_template is None:
         logging.error(f"No features in template '{image_name}'."); return []
 
-    # 2. Take screenshot and find its features
-    screenshot_path = take_screenshot(adb_id)
-    if not screenshot_path: return []
-    screen_img_color = cv2.imread(screenshot_path) # For drawing debug output
-    screen_img = cv2.cvtColor(screen_img_color, cv2.COLOR_BGR2GRAY)
-    if screen_img is None:
-        logging.error("Could not read screenshot."); return []
-    keypoints_screen, descriptors_screen = orb.detectAndCompute(screen_img, None)
+    # 2. Take screenshot and find its features in the search region
+    screen_img_color, screen_img = get_frame(adb_id) # Color frame is for drawing debug output
+    if screen_img_color is None: return []
+    x0, y0, x1, y1 = _feature_search_region(region, screen_img.shape)
+    search_area = screen_img[y0:y1, x0:x1]
+    keypoints_screen, descriptors_screen = _detect_features(_feature_detector(search_area.shape, screen_img.shape), search_area)
     if descriptors_screen is None:
         logging.warning("No features found on screen."); return []
 
     # 3. Find all good matches
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    all_matches = bf.knnMatch(descriptors_template, descriptors_screen, k=2)
-    good_matches = []
-    try:
-        for m, n in all_matches:
-            if m.distance < 0.8 * n.distance:
-                good_matches.append(m)
-    except ValueError:
-        pass # Not enough matches
+    good_matches = _good_feature_matches(descriptors_template, descriptors_screen, ratio_thresh=0.8)
 
     logging.info(f"Found {len(good_matches)} total good feature matches. Required: {min_match_count}.")
     if len(good_matches) < min_match_count:
         logging.info("Not enough good matches to proceed with clustering."); return []
 
     # 4. Get the locations of the good matches on the SCREEN
-    matched_points = np.float32([keypoints_screen[m.trainIdx].pt for m in good_matches])
+    matched_points = np.float32([keypoints_screen[m.trainIdx].pt for m in good_matches]) + np.float32([x0, y0])
     if len(matched_points) < min_samples:
         logging.info(f"Not enough matched points ({len(matched_points)}) for DBSCAN clustering (min_samples={min_samples})."); return []
 
@@ -492,56 +978,37 @@ def get_all_coords_from_features(adb_id, language, instance_name, workflow_name,
     # 5. Use DBSCAN to cluster these points.
     # 'eps' is a critical parameter to tune. It's roughly the max pixel distance within a single object.
     # 'min_samples' is also important. It's the minimum number of matched features to form a "dense" object.
-    db = DBSCAN(eps=eps, min_samples=min_samples).fit(matched_points)
-    labels = db.labels_
-    
-    unique_labels = set(labels)
-    centers = []
-    
-    # 6. Calculate the center of each found cluster
-    for k in unique_labels:
-        if k == -1:
-            # -1 represents noisy outliers that don't belong to any cluster
-            continue
-        
-        class_member_mask = (labels == k)
-        cluster_points = matched_points[class_member_mask]
-        
-        # Calculate the center of the cluster by averaging the coordinates
-        center_x = int(np.mean(cluster_points[:, 0]))
-        center_y = int(np.mean(cluster_points[:, 1]))
-        centers.append((center_x, center_y))
+    labels = _cluster_points(matched_points, eps, min_samples)
 
-        if SAVE_DEBUG_IMAGES:
-            # Draw a circle around the cluster for debugging
-            cv2.circle(screen_img_color, (center_x, center_y), int(eps), (0, 255, 0), 2)
-            cv2.putText(screen_img_color, f"Cluster {k}", (center_x, center_y - int(eps)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    # 6. Calculate the center of each found cluster
+    centers = _cluster_centers(matched_points, labels)
 
     if SAVE_DEBUG_IMAGES and centers:
+        # The centers are sorted below, so the writer thread gets its own copy
+        def draw(debug_img, found=list(centers)):
+            for k, (center_x, center_y) in enumerate(found):
+                # Draw a circle around the cluster for debugging
+                cv2.circle(debug_img, (center_x, center_y), int(eps), (0, 255, 0), 2)
+                cv2.putText(debug_img, f"Cluster {k}", (center_x, center_y - int(eps)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         # filename = f"DEBUG_all_feature_matches_{image_name.replace('.','_')}_{int(time.time())}.png"
         filename = f"{instance_name}_{workflow_name}_all_feature_matches_{image_name.replace('.','_')}.png"
-        cv2.imwrite(os.path.join(TEMP_DIR, filename), screen_img_color)
-        logging.debug(f"Saved all-feature-matches debug image to {filename}")
+        DEBUG_IMAGES.save(os.path.join(TEMP_DIR, filename), screen_img_color, draw)
+        logging.debug(f"Queued all-feature-matches debug image {filename}")
 
     # 7. Sort the centers for predictable order
     centers.sort(key=lambda p: (p[1], p[0]))
     
+    logging.debug(f"Feature search for all '{image_name}' took {(time.perf_counter() - search_start) * 1000:.1f} ms.")
     logging.info(f"Clustered into {len(centers)} instances of '{image_name}'. Coords: {centers}")
     return centers
 
-def send_email(subject, body):
-    recipient = general_config.get('recipient_email')
-    if not recipient: logging.warning("No recipient_email configured in instances.ini. Cannot send email."); return
-    logging.info(f"Sending email to {recipient}: '{subject}'")
-    try:
-        outlook = win32.Dispatch('outlook.application')
-        mail = outlook.CreateItem(0)
-        mail.To = recipient; mail.Subject = subject; mail.Body = body
-        mail.Send()
-    except Exception as e:
-        logging.error(f"Failed to send email via Outlook: {e}")
+def send_email(subject, body, urgent=False):
+    # Queued and delivered by the notifier thread (ce_notify), so a slow mail client does not stall the workflow
+    NOTIFIER.notify(subject, body, urgent=urgent)
 
 def emergency_exit(message):
     logging.critical(f"EMERGENCY EXIT: {message}")
-    send_email("CRITICAL ERROR in CE_AUTOMATION", message)
+    send_email("CRITICAL ERROR in CE_AUTOMATION", message, urgent=True)
+    # os._exit skips atexit handlers, so wait for the message here
+    NOTIFIER.flush(NOTIFY_EXIT_TIMEOUT)
     os._exit(1)
\ No newline at end of file
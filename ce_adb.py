@@ -0,0 +1,399 @@
+import atexit
+import logging
+import queue
+import socket
+import struct
+import subprocess
+import threading
+import time
+from ce_config import load_general_config
+
+general_config = load_general_config()
+# 'socket' talks to the ADB server directly; 'executable' runs the adb command line tool for every call
+ADB_TRANSPORT = general_config.get('adb_transport', 'socket')
+ADB_SERVER = (general_config.get('adb_server_host', '127.0.0.1'), general_config.get('adb_server_port', 5037))
+
+class AdbError(RuntimeError):
+    pass
+
+class AdbShellError(AdbError):
+    pass
+
+class AdbShellUnconfirmed(AdbShellError):
+    """The commands were written to the shell, but their completion was not confirmed. They may already have run."""
+    pass
+
+class AdbShellTimeout(AdbShellUnconfirmed):
+    pass
+
+class AdbClient:
+    """
+    Minimal client for the ADB server's socket protocol, so device calls do not start an adb process.
+    Every request is a 4-digit hex length followed by the request text, answered by OKAY or FAIL.
+    host:* requests are handled by the server itself; host:transport:<serial> binds the connection to
+    a device, after which one service (shell:, exec:, sync:) can be opened on it.
+    shell: and exec: streams end when the command finishes, so each call uses its own local connection.
+    sync: sessions stay usable after a transfer and are pooled per device.
+    All methods are thread-safe and raise AdbError on failure.
+    """
+    POOL_SIZE = 2 # idle sync sessions kept per device
+
+    def __init__(self, host='127.0.0.1', port=5037):
+        self.host = host
+        self.port = port
+        self._sync_pool = {} # serial -> [socket, ...]
+        self._pool_lock = threading.Lock()
+        self._server_started = False
+
+    def _connect(self, timeout):
+        try:
+            return socket.create_connection((self.host, self.port), timeout=timeout)
+        except ConnectionRefusedError:
+            if self._server_started: raise AdbError(f"ADB server at {self.host}:{self.port} refused the connection.")
+            # Same as the adb tool: start the server on first use if it is not running
+            logging.info("ADB server is not running. Starting it with 'adb start-server'.")
+            self._server_started = True
+            subprocess.run("adb start-server", shell=True, capture_output=True, timeout=30)
+            try:
+                return socket.create_connection((self.host, self.port), timeout=timeout)
+            except OSError as e:
+                raise AdbError(f"Could not connect to the ADB server at {self.host}:{self.port}: {e}") from e
+        except OSError as e:
+            raise AdbError(f"Could not connect to the ADB server at {self.host}:{self.port}: {e}") from e
+
+    @staticmethod
+    def _read_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk: raise AdbError("ADB connection closed unexpectedly.")
+            data += chunk
+        return bytes(data)
+
+    @classmethod
+    def _read_hex_block(cls, sock):
+        length = int(cls._read_exactly(sock, 4), 16)
+        return cls._read_exactly(sock, length).decode(errors='replace')
+
+    @staticmethod
+    def _read_all(sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk: return b"".join(chunks)
+            chunks.append(chunk)
+
+    @classmethod
+    def _request(cls, sock, request):
+        """Sends one request and checks the OKAY/FAIL status."""
+        payload = request.encode()
+        sock.sendall(f"{len(payload):04x}".encode() + payload)
+        status = cls._read_exactly(sock, 4)
+        if status == b"OKAY": return
+        if status == b"FAIL": raise AdbError(f"ADB request '{request}' failed: {cls._read_hex_block(sock)}")
+        raise AdbError(f"Unexpected ADB reply to '{request}': {status!r}")
+
+    def host_query(self, request, timeout=10):
+        """Runs a host request that answers with a length-prefixed text (e.g. host:devices)."""
+        try:
+            with self._connect(timeout) as sock:
+                self._request(sock, request)
+                return self._read_hex_block(sock)
+        except OSError as e:
+            raise AdbError(f"ADB request '{request}' failed: {e}") from e
+
+    def open_service(self, serial, service, timeout=15):
+        """Returns a socket bound to a device with the given service (e.g. 'shell:ls') opened on it."""
+        sock = self._connect(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}")
+            self._request(sock, service)
+            return sock
+        except (OSError, AdbError) as e:
+            sock.close()
+            raise AdbError(f"Could not open '{service}' on {serial}: {e}") from e
+
+    def run_service(self, serial, service, timeout=15):
+        """Opens a service and returns everything it writes until it closes the stream."""
+        sock = self.open_service(serial, service, timeout)
+        try:
+            with sock: return self._read_all(sock)
+        except OSError as e:
+            raise AdbError(f"'{service}' on {serial} failed: {e}") from e
+
+    def _sync_session(self, serial, timeout):
+        with self._pool_lock:
+            idle = self._sync_pool.get(serial)
+            sock = idle.pop() if idle else None
+        if sock is not None:
+            sock.settimeout(timeout)
+            return sock
+        return self.open_service(serial, "sync:", timeout)
+
+    def _release_sync_session(self, serial, sock):
+        with self._pool_lock:
+            idle = self._sync_pool.setdefault(serial, [])
+            if len(idle) < self.POOL_SIZE:
+                idle.append(sock); return
+        self._quit_sync(sock)
+
+    @staticmethod
+    def _quit_sync(sock):
+        try:
+            sock.sendall(b"QUIT" + struct.pack("<I", 0))
+        except OSError:
+            pass
+        sock.close()
+
+    def pull(self, serial, remote_path, timeout=30):
+        """Reads a file from the device with the sync protocol and returns its content."""
+        sock = self._sync_session(serial, timeout)
+        data, failure = bytearray(), None
+        try:
+            path = remote_path.encode()
+            sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+            while True:
+                header = self._read_exactly(sock, 8)
+                chunk_id, length = header[:4], struct.unpack("<I", header[4:])[0]
+                if chunk_id == b"DATA":
+                    data += self._read_exactly(sock, length)
+                elif chunk_id == b"DONE":
+                    break
+                elif chunk_id == b"FAIL":
+                    failure = self._read_exactly(sock, length).decode(errors='replace'); break
+                else:
+                    raise AdbError(f"unexpected sync reply {chunk_id!r}")
+        except (OSError, AdbError) as e:
+            sock.close()
+            raise AdbError(f"Could not pull '{remote_path}' from {serial}: {e}") from e
+        # The session is still in a clean state after DONE or FAIL, so it can be reused
+        self._release_sync_session(serial, sock)
+        if failure: raise AdbError(f"Could not pull '{remote_path}' from {serial}: {failure}")
+        return bytes(data)
+
+    def drop_device(self, serial):
+        """Closes the pooled sessions of a device (e.g. before it shuts down)."""
+        with self._pool_lock:
+            idle = self._sync_pool.pop(serial, [])
+        for sock in idle: self._quit_sync(sock)
+
+    def close(self):
+        with self._pool_lock:
+            serials = list(self._sync_pool)
+        for serial in serials: self.drop_device(serial)
+
+CLIENT = AdbClient(*ADB_SERVER)
+atexit.register(CLIENT.close)
+
+def _run_adb(args, timeout, text=False):
+    """Runs the adb command line tool. Used when adb_transport = executable."""
+    try:
+        result = subprocess.run(f"adb {args}", shell=True, check=True, capture_output=True, timeout=timeout, text=text)
+        return result.stdout
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr if text else e.stderr.decode(errors='replace')
+        raise AdbError(f"'adb {args}' failed: {stderr.strip()}") from e
+    except subprocess.TimeoutExpired as e:
+        raise AdbError(f"'adb {args}' timed out after {timeout}s.") from e
+
+def shell(adb_id, command, timeout=15):
+    """Runs a shell command on the device and returns its output as text."""
+    if ADB_TRANSPORT == 'executable':
+        return _run_adb(f'-s {adb_id} shell "{command}"', timeout, text=True)
+    return CLIENT.run_service(adb_id, f"shell:{command}", timeout).decode(errors='replace')
+
+def exec_out(adb_id, command, timeout=15):
+    """Runs a command on the device and returns its raw binary output (no terminal line-ending conversion)."""
+    if ADB_TRANSPORT == 'executable':
+        return _run_adb(f"-s {adb_id} exec-out {command}", timeout)
+    return CLIENT.run_service(adb_id, f"exec:{command}", timeout)
+
+def pull(adb_id, remote_path, local_path, timeout=30):
+    """Copies a file from the device to local_path."""
+    if ADB_TRANSPORT == 'executable':
+        _run_adb(f"-s {adb_id} pull {remote_path} {local_path}", timeout); return
+    data = CLIENT.pull(adb_id, remote_path, timeout)
+    with open(local_path, 'wb') as f:
+        f.write(data)
+
+def connect(address, timeout=10):
+    """Asks the ADB server to connect to a network device. Returns the server's message."""
+    if ADB_TRANSPORT == 'executable':
+        return _run_adb(f"connect {address}", timeout, text=True).strip()
+    return CLIENT.host_query(f"host:connect:{address}", timeout)
+
+def disconnect(address, timeout=10):
+    if ADB_TRANSPORT == 'executable':
+        _run_adb(f"disconnect {address}", timeout, text=True); return
+    CLIENT.drop_device(address)
+    CLIENT.host_query(f"host:disconnect:{address}", timeout)
+
+def devices(timeout=10):
+    """Returns {serial: state} for every device known to the ADB server."""
+    if ADB_TRANSPORT == 'executable':
+        output = _run_adb("devices", timeout, text=True).split('\n', 1)[-1] # Skip the 'List of devices attached' header
+    else:
+        output = CLIENT.host_query("host:devices", timeout)
+    return dict(line.split('\t', 1) for line in output.splitlines() if '\t' in line)
+
+def get_state(adb_id, timeout=10):
+    """Returns the device state ('device', 'offline', ...), or None if the server does not know the device."""
+    try:
+        if ADB_TRANSPORT == 'executable':
+            return _run_adb(f"-s {adb_id} get-state", timeout, text=True).strip()
+        return CLIENT.host_query(f"host-serial:{adb_id}:get-state", timeout).strip()
+    except AdbError:
+        return None
+
+class AdbShell:
+    """
+    A long-lived shell session for one device. Commands are written to the shell's stdin, so
+    sending an input event does not start a new adb process or connection each time.
+    Every command batch ends with an echoed marker, and run() returns once the marker comes back,
+    so the caller knows the commands have finished on the device.
+    If the session has died (emulator restarted, ADB reconnected) before the batch is written, it is
+    reopened and the batch is written to the new session. Once the batch has been written it is never
+    sent again: if no marker comes back (timeout or the shell exits), the commands may already have
+    run on the device, and AdbShellUnconfirmed is raised.
+    """
+    MARKER = "__CE_DONE_"
+
+    def __init__(self, adb_id):
+        self.adb_id = adb_id
+        self._process = None
+        self._sock = None
+        self._lines = None
+        self._closed = None # Set by the reader thread when the session's output ends
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        logging.debug(f"Opening persistent ADB shell for {self.adb_id}.")
+        self._lines = queue.Queue()
+        self._closed = threading.Event()
+        if ADB_TRANSPORT == 'executable':
+            self._process = subprocess.Popen(["adb", "-s", self.adb_id, "shell"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT, bufsize=0)
+            output = self._process.stdout
+        else:
+            # 'shell,raw:' opens a shell without a terminal; Android 6 and older only know plain 'shell:'
+            try:
+                self._sock = CLIENT.open_service(self.adb_id, "shell,raw:")
+            except AdbError:
+                self._sock = CLIENT.open_service(self.adb_id, "shell:")
+            self._sock.settimeout(None)
+            output = self._sock.makefile('rb')
+        # Pipes cannot be polled with a timeout on Windows, so a reader thread forwards the output lines
+        threading.Thread(target=self._read_output, args=(output, self._lines, self._closed), daemon=True).start()
+
+    @staticmethod
+    def _read_output(output, lines, closed):
+        try:
+            for line in iter(output.readline, b''):
+                lines.put(line.decode(errors='replace').rstrip('\r\n'))
+        except (OSError, ValueError):
+            pass
+        closed.set()
+        lines.put(None) # End of stream: the shell has exited
+
+    def _is_alive(self):
+        if self._closed is None or self._closed.is_set(): return False
+        if self._sock is not None: return True
+        return self._process is not None and self._process.poll() is None
+
+    def _write(self, data):
+        if self._sock is not None: self._sock.sendall(data)
+        else:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        if self._process is None: return
+        try:
+            self._process.stdin.close()
+            self._process.terminate()
+            self._process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+        self._process = None
+
+    def _deliver(self, commands):
+        """Writes a command batch to the shell, reopening the session first if it has died. Returns the batch's marker."""
+        if not self._is_alive():
+            self._close()
+            self._open()
+        self._counter += 1
+        marker = f"{self.MARKER}{self._counter}__"
+        self._write(f"{commands}; echo {marker}\n".encode())
+        return marker
+
+    def _wait_for_marker(self, marker, timeout):
+        """Collects the output of a written batch until its marker comes back."""
+        output = []
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise AdbShellTimeout(f"No reply from the ADB shell on {self.adb_id} within {timeout}s.")
+            if line is None:
+                raise AdbShellUnconfirmed(f"The ADB shell on {self.adb_id} exited before confirming the commands: {' '.join(output) or 'no output'}")
+            if line == marker: return "\n".join(output)
+            if line.endswith(f"echo {marker}"): continue # Our own command, echoed back by a terminal shell
+            output.append(line)
+
+    def run(self, commands, timeout=30):
+        """
+        Runs one or more shell commands ('cmd1; cmd2') and returns their combined output.
+        Raises AdbShellError if the commands could not be written even after reopening the session,
+        and AdbShellUnconfirmed if they were written but did not finish (they may have run).
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    marker = self._deliver(commands)
+                    break
+                except (OSError, AdbError) as e:
+                    self._close()
+                    if attempt == 2: raise AdbShellError(str(e)) from e
+                    logging.info(f"Persistent ADB shell on {self.adb_id} failed ({e}). Reconnecting.")
+            try:
+                return self._wait_for_marker(marker, timeout)
+            except AdbShellUnconfirmed:
+                self._close()
+                raise
+
+SHELLS = {}
+_shells_lock = threading.Lock()
+
+def get_shell(adb_id):
+    """Returns the persistent shell session of a device, creating it on first use."""
+    with _shells_lock:
+        if adb_id not in SHELLS:
+            SHELLS[adb_id] = AdbShell(adb_id)
+        return SHELLS[adb_id]
+
+def close_shell(adb_id):
+    with _shells_lock:
+        shell_session = SHELLS.pop(adb_id, None)
+    if shell_session: shell_session.close()
+    CLIENT.drop_device(adb_id)
+
+def close_all_shells():
+    with _shells_lock:
+        shells = list(SHELLS.values())
+        SHELLS.clear()
+    for shell_session in shells: shell_session.close()
+
+atexit.register(close_all_shells)
@@ -0,0 +1,109 @@
+import os
+import time
+import logging
+import threading
+from ce_config import load_general_config
+
+class LazyBackend:
+    """
+    A heavy optional library that is imported the first time it is needed instead of at startup.
+    get() returns whatever the loader returns (usually a module or a class) and caches it.
+    """
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_time = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded: return self._value
+        with self._lock:
+            if not self._loaded:
+                logging.info(f"Loading backend '{self.name}'...")
+                start = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except ImportError as e:
+                    logging.error(f"Backend '{self.name}' is not available: {e}")
+                    raise
+                self.load_time = time.perf_counter() - start
+                self._loaded = True
+                logging.info(f"Backend '{self.name}' loaded in {self.load_time:.2f}s (process memory now {memory_usage_mb():.0f} MB).")
+        return self._value
+
+BACKENDS = {}
+
+def register(name, loader):
+    BACKENDS[name] = LazyBackend(name, loader)
+    return BACKENDS[name]
+
+def get(name):
+    """Returns a backend, importing it on first use."""
+    return BACKENDS[name].get()
+
+def loaded_summary():
+    """Returns a one-line list of the backends loaded so far and what each one cost to import."""
+    loaded = [f"{b.name} ({b.load_time:.2f}s)" for b in BACKENDS.values() if b.loaded]
+    return ", ".join(loaded) if loaded else "none"
+
+def memory_usage_mb():
+    """Returns the resident memory of this process in MB, or 0.0 if it cannot be determined."""
+    try:
+        if os.name == 'nt':
+            import ctypes
+            from ctypes import wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+            if get_process_memory_info(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+            return 0.0
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, AttributeError, ValueError):
+        return 0.0
+
+def startup_report(started_at):
+    """Returns a one-line report of the time since started_at (a time.perf_counter() value) and the memory in use."""
+    return (f"Startup took {time.perf_counter() - started_at:.2f}s, process memory {memory_usage_mb():.0f} MB, "
+            f"heavy backends loaded: {loaded_summary()}")
+
+# --- Backend loaders ---
+# The imports are inside the functions so they only run on first use; PyInstaller still finds them.
+
+def _load_easyocr():
+    import easyocr
+    return easyocr
+
+def _load_pytesseract():
+    import pytesseract
+    tesseract_path = load_general_config().get('tesseract_path')
+    if tesseract_path:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    return pytesseract
+
+def _load_tesserocr():
+    import tesserocr
+    return tesserocr
+
+def _load_outlook():
+    import win32com.client as win32
+    return win32
+
+register('easyocr', _load_easyocr)
+register('pytesseract', _load_pytesseract)
+register('tesserocr', _load_tesserocr)
+register('outlook', _load_outlook)
@@ -1,6 +1,5 @@
 import configparser
 import logging
-import subprocess
 import time
 
 CONFIG_FILE = "instances.ini"
@@ -20,14 +19,68 @@ def load_general_config():
     """Loads settings from the [General] section."""
     settings = {
         'recipient_email': config.get('General', 'recipient_email', fallback=None),
+        'notification_backend': config.get('General', 'notification_backend', fallback='outlook').strip().lower(),
+        'smtp_host': config.get('General', 'smtp_host', fallback=None),
+        'smtp_port': config.getint('General', 'smtp_port', fallback=587),
+        'smtp_user': config.get('General', 'smtp_user', fallback=None),
+        'smtp_password': config.get('General', 'smtp_password', fallback=None),
+        'smtp_sender': config.get('General', 'smtp_sender', fallback=None),
+        'smtp_starttls': config.getboolean('General', 'smtp_starttls', fallback=True),
+        'notification_file': config.get('General', 'notification_file', fallback='logs/notifications.log').strip(),
+        'notification_digest': config.get('General', 'notification_digest', fallback='off').strip().lower(),
+        'notification_digest_window': config.getint('General', 'notification_digest_window', fallback=300),
+        'notification_retries': config.getint('General', 'notification_retries', fallback=3),
+        'notification_retry_delay': config.getfloat('General', 'notification_retry_delay', fallback=10.0),
+        'notification_exit_timeout': config.getfloat('General', 'notification_exit_timeout', fallback=30.0),
         'tesseract_path': config.get('General', 'tesseract_path', fallback=None),
         'emulator_boot_time': config.getint('General', 'emulator_boot_time', fallback=45),
         'log_level': config.get('General', 'log_level', fallback='INFO').strip().upper(),
         'save_debug_images': config.getboolean('General', 'save_debug_images', fallback=False),
+        'debug_image_async': config.getboolean('General', 'debug_image_async', fallback=True),
+        'debug_image_format': config.get('General', 'debug_image_format', fallback='png').strip().lower(),
+        'debug_image_png_compression': config.getint('General', 'debug_image_png_compression', fallback=1),
+        'debug_image_jpeg_quality': config.getint('General', 'debug_image_jpeg_quality', fallback=90),
+        'debug_image_queue_size': config.getint('General', 'debug_image_queue_size', fallback=32),
+        'screenshot_mode': config.get('General', 'screenshot_mode', fallback='exec-out').strip().lower(),
+        'frame_cache': config.getboolean('General', 'frame_cache', fallback=True),
+        'frame_cache_max_age': config.getfloat('General', 'frame_cache_max_age', fallback=2.0),
+        'template_cache_size': config.getint('General', 'template_cache_size', fallback=256),
+        'feature_matcher': config.get('General', 'feature_matcher', fallback='bf').strip().lower(),
+        'pyramid_matching': config.getboolean('General', 'pyramid_matching', fallback=False),
+        'pyramid_scale': config.getfloat('General', 'pyramid_scale', fallback=0.5),
+        'settle_after_input': config.getboolean('General', 'settle_after_input', fallback=False),
+        'settle_threshold': config.getfloat('General', 'settle_threshold', fallback=2.0),
+        'settle_min_wait': config.getfloat('General', 'settle_min_wait', fallback=0.3),
+        'settle_max_wait': config.getfloat('General', 'settle_max_wait', fallback=3.0),
+        'wait_poll_interval': config.getfloat('General', 'wait_poll_interval', fallback=1.0),
+        'match_workers': config.getint('General', 'match_workers', fallback=4),
+        'screen_match_threshold': config.getfloat('General', 'screen_match_threshold', fallback=0.9),
+        'location_hints': config.getboolean('General', 'location_hints', fallback=True),
+        'location_hint_padding': config.getint('General', 'location_hint_padding', fallback=40),
+        'location_hint_max_age_days': config.getint('General', 'location_hint_max_age_days', fallback=14),
         #'game_load_check_region': config.get('General', 'game_load_check_region', fallback=None),
         'game_load_check_image': config.get('General', 'game_load_check_image', fallback=None),
         #'game_load_check_text': config.get('General', 'game_load_check_text', fallback=None),
-        'game_load_check_threshold': config.getfloat('General', 'game_load_check_threshold', fallback=0.85)
+        'game_load_check_threshold': config.getfloat('General', 'game_load_check_threshold', fallback=0.85),
+        'adb_transport': config.get('General', 'adb_transport', fallback='socket').strip().lower(),
+        'adb_server_host': config.get('General', 'adb_server_host', fallback='127.0.0.1').strip(),
+        'adb_server_port': config.getint('General', 'adb_server_port', fallback=5037),
+        'persistent_shell': config.getboolean('General', 'persistent_shell', fallback=True),
+        'batch_clicks': config.getboolean('General', 'batch_clicks', fallback=True),
+        'tap_batch_interval': config.getfloat('General', 'tap_batch_interval', fallback=1.0),
+        'tesseract_engine': config.get('General', 'tesseract_engine', fallback='auto').strip().lower(),
+        'tesseract_profile': config.get('General', 'tesseract_profile', fallback='default').strip(),
+        'ocr_cache': config.getboolean('General', 'ocr_cache', fallback=True),
+        'ocr_cache_size': config.getint('General', 'ocr_cache_size', fallback=2000),
+        'ocr_cache_persist': config.getboolean('General', 'ocr_cache_persist', fallback=False),
+        'ocr_service': config.getboolean('General', 'ocr_service', fallback=True),
+        'ocr_service_port': config.getint('General', 'ocr_service_port', fallback=6150),
+        'ocr_service_max_memory_mb': config.getint('General', 'ocr_service_max_memory_mb', fallback=4096),
+        'readiness_polling': config.getboolean('General', 'readiness_polling', fallback=True),
+        'adb_ready_timeout': config.getint('General', 'adb_ready_timeout', fallback=120),
+        'boot_completed_timeout': config.getint('General', 'boot_completed_timeout', fallback=120),
+        'game_load_timeout': config.getint('General', 'game_load_timeout', fallback=180),
+        'readiness_poll_interval': config.getfloat('General', 'readiness_poll_interval', fallback=2.0)
     }
     return settings
 
@@ -41,7 +94,7 @@ def load_instances():
     logging.info("Loading instances from the INI file.")
     instances = {}
     for section in config.sections():
-        if section in ["EmulatorType", "General", "RunOrder", "Hotkeys"]:
+        if section in ["EmulatorType", "General", "RunOrder", "Hotkeys", "OCRProfiles"]:
             continue
         details = {
             "name": section,
@@ -56,21 +109,30 @@ def load_instances():
     return instances
 
 # ... (The rest of the file: connect_adb_to_instance, load_run_order, load_hotkey_config remains exactly the same) ...
-def connect_adb_to_instance(instance_name, logger=logging):
+def get_adb_id(instance_name, logger=logging):
+    """Returns the ADB serial (127.0.0.1:<adb_port>) of an instance, or None if it has no port configured."""
     if not config.has_section(instance_name): logger.error(f"Instance '{instance_name}' not found in {CONFIG_FILE}."); return None
     port = config.get(instance_name, "adb_port", fallback=None)
     if not port: logger.warning(f"No ADB port mapping found for instance {instance_name} in {CONFIG_FILE}."); return None
-    adb_id = f"127.0.0.1:{port}"
+    return f"127.0.0.1:{port}"
+
+def connect_adb_to_instance(instance_name, logger=logging):
+    # Imported here because ce_adb reads its own settings from this module
+    import ce_adb
+    adb_id = get_adb_id(instance_name, logger)
+    if not adb_id: return None
     try:
         logger.info(f"Connecting ADB to {adb_id} for instance {instance_name}...")
-        subprocess.run(f"adb disconnect {adb_id}", shell=True, capture_output=True)
+        try:
+            ce_adb.disconnect(adb_id)
+        except ce_adb.AdbError:
+            pass # Not connected yet
         time.sleep(1)
-        connect_result = subprocess.run(f"adb connect {adb_id}", shell=True, check=True, capture_output=True, text=True)
-        if "unable to connect" in connect_result.stdout.lower() or "failed to connect" in connect_result.stdout.lower():
+        connect_message = ce_adb.connect(adb_id)
+        if "unable to connect" in connect_message.lower() or "failed to connect" in connect_message.lower():
              logger.error(f"ADB connection command failed for {adb_id}."); return None
         for _ in range(15):
-            result = subprocess.run("adb devices", shell=True, capture_output=True, text=True)
-            if adb_id in result.stdout and "device" in result.stdout:
+            if ce_adb.devices().get(adb_id) == "device":
                 logger.info(f"ADB device {adb_id} is connected and ready."); return adb_id
             time.sleep(1)
         logger.error(f"ADB device {adb_id} not detected after waiting.")
@@ -107,6 +169,30 @@ def load_run_order():
     logging.info(f"Active workflow set: {active_set if active_set else 'None'}")
     return order_list, start_instance, active_set # Return the new value
 
+def load_parallel_instances():
+    """Returns how many instances ce_robot may run at the same time (parallel_instances in [RunOrder])."""
+    parallel = config.getint("RunOrder", "parallel_instances", fallback=1) if config.has_section("RunOrder") else 1
+    if parallel < 1:
+        logging.warning(f"Invalid parallel_instances value {parallel}. Using 1.")
+        parallel = 1
+    logging.info(f"Parallel instances: {parallel}")
+    return parallel
+
+def load_ocr_profiles():
+    """
+    Loads the Tesseract preprocessing profiles from the [OCRProfiles] section.
+    Each entry is 'name = key=value, key=value' with the keys scale, interpolation, clahe and close.
+    """
+    profiles = {}
+    if config.has_section("OCRProfiles"):
+        for name, value in config.items("OCRProfiles"):
+            settings = {}
+            for item in value.split(","):
+                key, _, setting = item.partition("=")
+                if key.strip() and setting.strip(): settings[key.strip().lower()] = setting.strip().lower()
+            profiles[name] = settings
+    return profiles
+
 def load_hotkey_config():
     hotkeys = {'pause_resume': 'ctrl+p', 'emergency_stop': 'ctrl+h'}
     if config.has_section("Hotkeys"):
@@ -0,0 +1,90 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import cv2
+from ce_config import load_general_config
+
+class DebugImageWriter:
+    """
+    Saves debug images (save_debug_images = True) on a background thread, so encoding and writing
+    them does not slow down the workflow. The caller hands over the image and an optional draw
+    function; drawing happens on a copy in the writer thread, so read-only frames can be passed as is.
+    The queue is bounded: when it is full, the oldest waiting image is dropped.
+    """
+    def __init__(self, image_format='png', png_compression=1, jpeg_quality=90, max_queue=32, background=True):
+        self.image_format = 'jpg' if image_format in ('jpg', 'jpeg') else 'png'
+        if self.image_format == 'jpg': self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        else: self.params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        self.background = background
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'saved': 0, 'dropped': 0, 'failed': 0}
+
+    def _target_path(self, path):
+        return f"{os.path.splitext(path)[0]}.{self.image_format}"
+
+    def save(self, path, image, draw=None):
+        """
+        Queues an image to be written to path (the extension follows debug_image_format).
+        draw, if given, is called with a writable copy of the image before it is saved.
+        """
+        if not self.background:
+            self._write(self._target_path(path), image, draw); return
+        self._ensure_thread()
+        item = (self._target_path(path), image, draw)
+        while True:
+            try:
+                self._queue.put_nowait(item); return
+            except queue.Full:
+                try:
+                    dropped = self._queue.get_nowait()
+                    self._queue.task_done()
+                    self.stats['dropped'] += 1
+                    logging.debug(f"Debug image queue full. Dropped '{dropped[0]}'.")
+                except queue.Empty:
+                    pass
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="CE-DebugImages", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path, image, draw = self._queue.get()
+            try:
+                self._write(path, image, draw)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, image, draw):
+        try:
+            if draw is not None:
+                image = image.copy()
+                draw(image)
+            if cv2.imwrite(path, image, self.params): self.stats['saved'] += 1
+            else:
+                self.stats['failed'] += 1
+                logging.warning(f"Could not save debug image '{path}'.")
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.warning(f"Could not save debug image '{path}': {e}")
+
+    def flush(self):
+        """Waits until every queued image has been written."""
+        if self._thread is not None and self._thread.is_alive(): self._queue.join()
+
+    def summary(self):
+        return f"{self.stats['saved']} saved, {self.stats['dropped']} dropped (queue full), {self.stats['failed']} failed"
+
+general_config = load_general_config()
+DEBUG_IMAGES = DebugImageWriter(image_format=general_config.get('debug_image_format', 'png'),
+                                png_compression=general_config.get('debug_image_png_compression', 1),
+                                jpeg_quality=general_config.get('debug_image_jpeg_quality', 90),
+                                max_queue=general_config.get('debug_image_queue_size', 32),
+                                background=general_config.get('debug_image_async', True))
+atexit.register(DEBUG_IMAGES.flush)
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from ce_config import load_general_config
+
+CACHE_DIR = "cache"
+
+class LocationHints:
+    """
+    Remembers where each template was last found on each instance, so the locators can search a small
+    region around that spot before falling back to a full-screen search.
+    Hints are stored per instance in cache/location_hints_<instance>.json and survive restarts.
+    Entries that have not been confirmed for max_age_days are dropped.
+    """
+    SAVE_INTERVAL = 30 # seconds between writes of a changed hint file
+
+    def __init__(self, cache_dir=CACHE_DIR, max_age_days=14):
+        self.cache_dir = cache_dir
+        self.max_age = max_age_days * 86400
+        self._hints = {} # instance_name -> {image_name: {'box': [x, y, w, h], 'last_seen': timestamp}}
+        self._dirty = set()
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'no_hint': 0}
+
+    def _hint_path(self, instance_name):
+        safe_name = "".join(c if c.isalnum() or c in '-_' else '_' for c in str(instance_name))
+        return os.path.join(self.cache_dir, f"location_hints_{safe_name}.json")
+
+    def _instance_hints(self, instance_name):
+        """Returns the hints of an instance, loading them from disk on first use. Call with the lock held."""
+        if instance_name not in self._hints:
+            hints = {}
+            hint_path = self._hint_path(instance_name)
+            if os.path.exists(hint_path):
+                try:
+                    with open(hint_path, 'r') as f:
+                        hints = json.load(f)
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not read location hints '{hint_path}': {e}. Starting with no hints.")
+            now = time.time()
+            stale = [name for name, hint in hints.items() if now - hint.get('last_seen', 0) > self.max_age]
+            for name in stale: del hints[name]
+            if stale: self._dirty.add(instance_name)
+            self._hints[instance_name] = hints
+        return self._hints[instance_name]
+
+    def lookup(self, instance_name, image_name):
+        """Returns the last known (x, y, w, h) box of a template on an instance, or None."""
+        with self._lock:
+            hint = self._instance_hints(instance_name).get(image_name)
+            if hint is None:
+                self.stats['no_hint'] += 1
+                return None
+            if time.time() - hint['last_seen'] > self.max_age:
+                del self._hints[instance_name][image_name]
+                self._dirty.add(instance_name)
+                self.stats['no_hint'] += 1
+                return None
+            return tuple(hint['box'])
+
+    def record_hit(self, instance_name, image_name, box):
+        # Called from the matching threads of get_coords_from_images, so the counters are updated under the lock
+        with self._lock:
+            self.stats['hits'] += 1
+        self.update(instance_name, image_name, box)
+
+    def record_miss(self, instance_name, image_name):
+        with self._lock:
+            self.stats['misses'] += 1
+        logging.debug(f"Location hint for '{image_name}' missed on '{instance_name}'. Falling back to a full-screen search.")
+
+    def update(self, instance_name, image_name, box):
+        """Stores the (x, y, w, h) box where a template was just found."""
+        with self._lock:
+            self._instance_hints(instance_name)[image_name] = {'box': [int(v) for v in box], 'last_seen': time.time()}
+            self._dirty.add(instance_name)
+            save_due = time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+        if save_due: self.save()
+
+    def save(self):
+        """Writes the hint files of all instances that changed since the last save."""
+        with self._lock:
+            pending = {name: dict(self._hints.get(name, {})) for name in self._dirty}
+            self._dirty.clear()
+            self._last_save = time.monotonic()
+        for instance_name, hints in pending.items():
+            hint_path = self._hint_path(instance_name)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(hint_path + ".tmp", 'w') as f:
+                    json.dump(hints, f, indent=2)
+                os.replace(hint_path + ".tmp", hint_path)
+            except OSError as e:
+                logging.warning(f"Could not save location hints '{hint_path}': {e}")
+
+    def hit_rate(self):
+        tried = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / tried if tried else 0.0
+
+    def summary(self):
+        return (f"{self.stats['hits']} hits, {self.stats['misses']} misses, {self.stats['no_hint']} lookups without a hint "
+                f"(hit rate {self.hit_rate():.0%})")
+
+general_config = load_general_config()
+HINTS = LocationHints(max_age_days=general_config.get('location_hint_max_age_days', 14))
+atexit.register(HINTS.save)
@@ -23,7 +23,8 @@ def setup_hotkey_listener(pause_event, stop_event, hotkeys_config):
             logging.critical("--- EMERGENCY STOP HOTKEY PRESSED! ---")
             ce_actions.send_email(
                 subject="CE Automation: EMERGENCY STOP ACTIVATED",
-                body="The emergency stop hotkey was pressed. The script will terminate after the current action."
+                body="The emergency stop hotkey was pressed. The script will terminate after the current action.",
+                urgent=True
             )
             stop_event.set()
 
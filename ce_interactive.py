@@ -17,14 +17,9 @@ def get_coords_from_click(adb_id):
     Takes a screenshot, displays it, and waits for the user to click.
     Returns the (x, y) coordinates of the click.
     """
-    screenshot_path = ce_actions.take_screenshot(adb_id)
-    if not screenshot_path:
-        print("ERROR: Could not get screenshot from device.")
-        return None
-
-    img = cv2.imread(screenshot_path)
+    img = ce_actions.capture_screen(adb_id)
     if img is None:
-        print(f"ERROR: Could not read image file at {screenshot_path}")
+        print("ERROR: Could not get screenshot from device.")
         return None
 
     state = MouseState()
@@ -45,8 +40,7 @@ def get_coords_from_click(adb_id):
     print("\nINFO: A window has appeared. Click on it to select your desired coordinates.")
     cv2.waitKey(0)  # Wait indefinitely for any key press
     cv2.destroyAllWindows()
-    
-    os.remove(screenshot_path) # Clean up the full screenshot
+
     return state.point
 
 def get_region_from_drag(adb_id):
@@ -54,14 +48,9 @@ def get_region_from_drag(adb_id):
     Takes a screenshot, displays it, and lets the user drag to select a region.
     Returns the region as (x, y, w, h) and saves the cropped image.
     """
-    screenshot_path = ce_actions.take_screenshot(adb_id)
-    if not screenshot_path:
-        print("ERROR: Could not get screenshot from device.")
-        return None
-
-    img_original = cv2.imread(screenshot_path)
+    img_original = ce_actions.capture_screen(adb_id)
     if img_original is None:
-        print(f"ERROR: Could not read image file at {screenshot_path}")
+        print("ERROR: Could not get screenshot from device.")
         return None
 
     img_clone = img_original.copy()
@@ -111,5 +100,4 @@ def get_region_from_drag(adb_id):
     cv2.waitKey(0)
     cv2.destroyAllWindows()
 
-    os.remove(screenshot_path) # Clean up the full screenshot
     return state.region
\ No newline at end of file
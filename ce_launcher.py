@@ -3,6 +3,10 @@ import logging
 import os
 import signal
 import time
+from ce_config import get_adb_id
+import ce_adb
+from ce_adb import close_shell, AdbError
+import ce_actions
 
 def launch_instance(name, command):
     """
@@ -33,17 +37,18 @@ def terminate_instance(process, adb_id):
         return
 
     logging.info(f"Attempting to terminate instance (PID: {process.pid}, ADB ID: {adb_id}).")
+    if adb_id: close_shell(adb_id)
 
     # --- Primary Method: Graceful shutdown via ADB ---
     if adb_id:
         try:
             logging.info(f"Sending shutdown command to {adb_id} via ADB...")
             # The 'reboot -p' command tells the Android system to power off
-            subprocess.run(f"adb -s {adb_id} reboot -p", shell=True, check=True, capture_output=True, timeout=15)
+            ce_adb.shell(adb_id, "reboot -p", timeout=15)
             logging.info(f"ADB shutdown command sent successfully to {adb_id}.")
             # Give the emulator a moment to process the shutdown and close its window
             time.sleep(5)
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        except AdbError as e:
             logging.warning(f"ADB shutdown command for {adb_id} failed or timed out: {e}. Proceeding to fallback termination.")
         except Exception as e:
             logging.error(f"An unexpected error occurred during ADB shutdown for {adb_id}: {e}")
@@ -67,4 +72,71 @@ def terminate_instance(process, adb_id):
         except Exception as e:
              logging.error(f"An unexpected error occurred during fallback termination of PID {process.pid}: {e}")
     else:
-        logging.info(f"Instance with PID {process.pid} has already terminated.")
\ No newline at end of file
+        logging.info(f"Instance with PID {process.pid} has already terminated.")
+
+def _adb_is_reachable(adb_id):
+    """Connects ADB to the device and returns True once it reports the 'device' state."""
+    try:
+        ce_adb.connect(adb_id)
+    except AdbError:
+        return False
+    return ce_adb.get_state(adb_id) == "device"
+
+def _boot_is_completed(adb_id):
+    """Returns True once Android reports sys.boot_completed=1."""
+    try:
+        return ce_adb.shell(adb_id, "getprop sys.boot_completed", timeout=10).strip() == "1"
+    except AdbError:
+        return False
+
+def _game_is_loaded(adb_id, language, name, check_image, threshold):
+    """Returns True once the game_load_check_image is visible on a fresh screenshot."""
+    ce_actions.invalidate_frame(adb_id)
+    return ce_actions.get_coords_from_image(adb_id, language, name, "Startup_Check", check_image, threshold) is not None
+
+def _poll(probe, timeout, interval, on_poll=None):
+    """Calls probe() every 'interval' seconds until it returns True or 'timeout' seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if on_poll: on_poll()
+        if probe(): return True
+        if time.monotonic() + interval > deadline: return False
+        time.sleep(interval)
+
+def wait_for_instance_ready(name, language, settings, on_poll=None):
+    """
+    Waits for a freshly launched instance to become usable, in three stages:
+    ADB reachable, Android boot completed, and the game_load_check_image visible on screen.
+    Each stage has its own timeout from the [General] settings, and the instance is handed over
+    as soon as all stages pass. on_poll is called before every probe (e.g. to honour the pause hotkey).
+    Returns (adb_id, timings, failed_stage), where timings maps each finished stage to its duration
+    in seconds and failed_stage is None on success.
+    """
+    interval = settings.get('readiness_poll_interval', 2.0)
+    check_image = settings.get('game_load_check_image')
+    timings = {}
+    adb_id = get_adb_id(name)
+    if not adb_id: return None, timings, 'adb'
+
+    stages = [('adb', lambda timeout: _poll(lambda: _adb_is_reachable(adb_id), timeout, interval, on_poll), settings.get('adb_ready_timeout', 120)),
+              ('boot_completed', lambda timeout: _poll(lambda: _boot_is_completed(adb_id), timeout, interval, on_poll), settings.get('boot_completed_timeout', 120))]
+    if check_image:
+        stages.append(('game_load', lambda timeout: _poll(lambda: _game_is_loaded(adb_id, language, name, check_image, settings.get('game_load_check_threshold', 0.85)),
+                                                          timeout, interval, on_poll), settings.get('game_load_timeout', 180)))
+    else:
+        logging.info("Global game load verification image not configured. Skipping the game load stage.")
+
+    for stage, wait, timeout in stages:
+        logging.info(f"Waiting up to {timeout}s for '{name}' readiness stage '{stage}'...")
+        start = time.monotonic()
+        passed = wait(timeout)
+        timings[stage] = time.monotonic() - start
+        if not passed:
+            logging.warning(f"Instance '{name}' did not pass readiness stage '{stage}' within {timeout}s.")
+            return adb_id, timings, stage
+        logging.info(f"Readiness stage '{stage}' passed after {timings[stage]:.1f}s.")
+    logging.info(f"Instance '{name}' is ready after {sum(timings.values()):.1f}s ({format_timings(timings)}).")
+    return adb_id, timings, None
+
+def format_timings(timings):
+    return ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
@@ -0,0 +1,197 @@
+import os
+import time
+import queue
+import atexit
+import smtplib
+import logging
+import threading
+from datetime import datetime
+from email.message import EmailMessage
+from ce_config import load_general_config
+import ce_backends
+
+general_config = load_general_config()
+
+# --- Delivery backends ---
+# Each backend has send(recipient, subject, body), which raises an exception when delivery fails.
+
+class OutlookBackend:
+    """Sends mail through the local Outlook client (COM)."""
+    name = 'outlook'
+
+    def __init__(self):
+        self._com_initialized = False
+
+    def send(self, recipient, subject, body):
+        win32 = ce_backends.get('outlook')
+        if not self._com_initialized:
+            # COM must be initialized in every thread that uses it, and delivery runs on the notifier thread
+            import pythoncom
+            pythoncom.CoInitialize()
+            self._com_initialized = True
+        mail = win32.Dispatch('outlook.application').CreateItem(0)
+        mail.To = recipient; mail.Subject = subject; mail.Body = body
+        mail.Send()
+
+class SmtpBackend:
+    """Sends mail through an SMTP server (smtp_* settings in instances.ini)."""
+    name = 'smtp'
+
+    def __init__(self, host, port=587, user=None, password=None, sender=None, starttls=True, timeout=30):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.sender = sender or user
+        self.starttls, self.timeout = starttls, timeout
+
+    def send(self, recipient, subject, body):
+        if not self.host: raise ValueError("smtp_host is not configured.")
+        message = EmailMessage()
+        message['From'] = self.sender or recipient
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as server:
+            if self.starttls: server.starttls()
+            if self.user: server.login(self.user, self.password or "")
+            server.send_message(message)
+
+class FileBackend:
+    """Appends notifications to a local file instead of sending them. Useful for testing workflows."""
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, recipient, subject, body):
+        directory = os.path.dirname(self.path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"=== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | To: {recipient} | {subject}\n{body}\n\n")
+
+def create_backend(name, settings):
+    if name == 'smtp':
+        return SmtpBackend(settings.get('smtp_host'), settings.get('smtp_port', 587), settings.get('smtp_user'),
+                           settings.get('smtp_password'), settings.get('smtp_sender'), settings.get('smtp_starttls', True))
+    if name == 'file':
+        return FileBackend(settings.get('notification_file', os.path.join('logs', 'notifications.log')))
+    if name != 'outlook':
+        logging.warning(f"Unknown notification_backend '{name}'. Using 'outlook'.")
+    return OutlookBackend()
+
+# --- Queue and delivery worker ---
+
+class Notifier:
+    """
+    Delivers notifications from a background thread, so a slow or hung mail client never stalls automation.
+    Failed deliveries are retried with a growing delay.
+    digest = 'off' sends every message on its own. 'window' collects the messages of digest_window seconds
+    into one mail, and 'run' collects everything until the end of the run. Urgent messages (emergency
+    stops) are sent immediately, together with whatever is waiting.
+    """
+    def __init__(self, backend, recipient, digest='off', digest_window=300, retries=3, retry_delay=10):
+        self.backend = backend
+        self.recipient = recipient
+        self.digest = digest if digest in ('off', 'window', 'run') else 'off'
+        self.digest_window = digest_window
+        self.retries = max(1, retries)
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._done = threading.Condition()
+        self._unfinished = 0 # Queued items (messages and flush markers) not yet delivered or given up on
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0}
+
+    def notify(self, subject, body, urgent=False):
+        """Queues a notification and returns immediately."""
+        if not self.recipient:
+            logging.warning("No recipient_email configured in instances.ini. Cannot send email."); return
+        logging.info(f"Queued email to {self.recipient}: '{subject}'")
+        self.stats['queued'] += 1
+        self._put((datetime.now(), subject, body, urgent))
+
+    def _put(self, item):
+        with self._done:
+            self._unfinished += 1
+        self._queue.put(item)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="CE-Notifier", daemon=True)
+                self._thread.start()
+
+    def _finished(self, count):
+        with self._done:
+            self._unfinished -= count
+            self._done.notify_all()
+
+    def _run(self):
+        pending = [] # Messages waiting for the current digest
+        window_end = None
+        while True:
+            timeout = None if window_end is None else max(0.0, window_end - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            flush = False
+            if item is not None:
+                if item[1] is None: # flush() marker: send what is pending now
+                    flush = True
+                    self._finished(1)
+                else:
+                    pending.append(item)
+                    if self.digest == 'window' and window_end is None: window_end = time.monotonic() + self.digest_window
+                    flush = self.digest == 'off' or item[3]
+            elif window_end is not None:
+                flush = True
+            # A steady stream of messages never lets get() time out, so the window end is also checked here
+            if window_end is not None and time.monotonic() >= window_end: flush = True
+            if flush and pending:
+                self._deliver(pending)
+                self._finished(len(pending))
+                pending, window_end = [], None
+
+    def _deliver(self, messages):
+        if len(messages) == 1:
+            _, subject, body, _ = messages[0]
+        else:
+            subject = f"CE Automation: {len(messages)} notifications"
+            body = "\n\n".join(f"[{queued_at.strftime('%Y-%m-%d %H:%M:%S')}] {msg_subject}\n{msg_body}" for queued_at, msg_subject, msg_body, _ in messages)
+        for attempt in range(1, self.retries + 1):
+            try:
+                start = time.perf_counter()
+                self.backend.send(self.recipient, subject, body)
+                self.stats['sent'] += len(messages)
+                logging.info(f"Sent email to {self.recipient} via {self.backend.name}: '{subject}' ({time.perf_counter() - start:.1f}s).")
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    self.stats['failed'] += len(messages)
+                    logging.error(f"Failed to send email '{subject}' via {self.backend.name} after {attempt} attempts: {e}")
+                    return
+                delay = self.retry_delay * attempt
+                logging.warning(f"Sending email '{subject}' via {self.backend.name} failed ({e}). Retrying in {delay}s.")
+                time.sleep(delay)
+
+    def flush(self, timeout=30):
+        """
+        Sends all waiting messages, including an unfinished digest, and waits up to timeout seconds for delivery.
+        Returns True if everything was delivered (or given up on) in time.
+        """
+        if self._thread is None or not self._thread.is_alive(): return True
+        self._put((None, None, None, True))
+        with self._done:
+            done = self._done.wait_for(lambda: self._unfinished == 0, timeout)
+        if not done: logging.warning(f"Notifications still being delivered after {timeout}s. Not waiting any longer.")
+        return done
+
+    def summary(self):
+        return f"{self.stats['queued']} queued, {self.stats['sent']} sent, {self.stats['failed']} failed"
+
+NOTIFIER = Notifier(create_backend(general_config.get('notification_backend', 'outlook'), general_config),
+                    general_config.get('recipient_email'),
+                    digest=general_config.get('notification_digest', 'off'),
+                    digest_window=general_config.get('notification_digest_window', 300),
+                    retries=general_config.get('notification_retries', 3),
+                    retry_delay=general_config.get('notification_retry_delay', 10))
+EXIT_TIMEOUT = general_config.get('notification_exit_timeout', 30)
+atexit.register(lambda: NOTIFIER.flush(EXIT_TIMEOUT))
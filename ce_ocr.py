@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import importlib.util
+import logging
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from ce_config import load_general_config, load_ocr_profiles
+import ce_backends
+
+general_config = load_general_config()
+TESSERACT_ENGINE = general_config.get('tesseract_engine', 'auto')
+TESSERACT_PROFILE = general_config.get('tesseract_profile', 'default')
+TESSERACT_CONFIG = r'--oem 1 --psm 7'
+CACHE_DIR = "cache"
+
+INTERPOLATIONS = {'nearest': cv2.INTER_NEAREST, 'linear': cv2.INTER_LINEAR, 'cubic': cv2.INTER_CUBIC,
+                  'area': cv2.INTER_AREA, 'lanczos4': cv2.INTER_LANCZOS4}
+
+class OcrProfile:
+    """
+    Preprocessing applied to a region before Tesseract reads it: upscale, grayscale, optional CLAHE
+    contrast enhancement, Otsu threshold and an optional morphological close.
+    The CLAHE object and the kernel are built once per profile (per thread for CLAHE) and reused.
+    """
+    def __init__(self, name, scale=3.0, interpolation='lanczos4', clahe=2.0, close=2):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation '{interpolation}'. Valid options: {', '.join(INTERPOLATIONS)}")
+        self.name = name
+        self.scale = float(scale)
+        self.interpolation = interpolation
+        self.clahe_clip = float(clahe)
+        self.kernel = np.ones((int(close), int(close)), np.uint8) if int(close) > 1 else None
+        self._local = threading.local()
+
+    def _clahe(self):
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = self._local.clahe = cv2.createCLAHE(clipLimit=self.clahe_clip, tileGridSize=(8, 8))
+        return clahe
+
+    def describe(self):
+        """Returns the profile's settings as text. Also part of the OCR result cache key."""
+        close = self.kernel.shape[0] if self.kernel is not None else 0
+        return f"scale={self.scale:g}, interpolation={self.interpolation}, clahe={self.clahe_clip:g}, close={close}"
+
+    def preprocess(self, region):
+        if self.scale != 1.0:
+            region = cv2.resize(region, (int(region.shape[1] * self.scale), int(region.shape[0] * self.scale)),
+                                interpolation=INTERPOLATIONS[self.interpolation])
+        gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else region
+        if self.clahe_clip > 0:
+            gray = self._clahe().apply(gray)
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if self.kernel is not None:
+            thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, self.kernel)
+        return thresh
+
+def _build_profiles():
+    # 'default' reproduces the original compare_with_text preprocessing
+    profiles = {'default': OcrProfile('default'),
+                'fast': OcrProfile('fast', scale=2, interpolation='linear')}
+    for name, settings in load_ocr_profiles().items():
+        try:
+            profiles[name] = OcrProfile(name, **settings)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Invalid OCR profile '{name}' in [OCRProfiles]: {e}. Ignoring it.")
+    return profiles
+
+PROFILES = _build_profiles()
+
+def get_profile(name=None):
+    """Returns a preprocessing profile by name; unknown names fall back to the tesseract_profile setting."""
+    profile = PROFILES.get(name or TESSERACT_PROFILE)
+    if profile is None:
+        logging.warning(f"Unknown OCR profile '{name}'. Using '{TESSERACT_PROFILE}'.")
+        profile = PROFILES.get(TESSERACT_PROFILE, PROFILES['default'])
+    return profile
+
+class TesseractEngine:
+    """
+    Runs Tesseract either through a persistent in-process API (tesserocr), which keeps the engine and
+    its language data loaded between calls, or through the tesseract executable (pytesseract).
+    'auto' uses the API when tesserocr is installed and falls back to the executable otherwise.
+    Latency is recorded per engine and profile.
+    """
+    def __init__(self, mode='auto'):
+        self.mode = mode
+        self._api = None
+        # In 'auto' mode a missing tesserocr is expected, so it is not reported as an error
+        self._api_failed = mode == 'cli' or (mode == 'auto' and importlib.util.find_spec('tesserocr') is None)
+        self._lock = threading.Lock() # A Tesseract API instance handles one image at a time
+        self.stats = {} # (engine, profile) -> {'calls', 'total', 'max'}
+
+    def _get_api(self):
+        if self._api is None and not self._api_failed:
+            try:
+                tesserocr = ce_backends.get('tesserocr')
+                tesseract_path = general_config.get('tesseract_path')
+                tessdata = os.path.join(os.path.dirname(tesseract_path), 'tessdata') if tesseract_path else None
+                kwargs = {'path': tessdata} if tessdata and os.path.isdir(tessdata) else {}
+                self._api = tesserocr.PyTessBaseAPI(lang='eng', psm=tesserocr.PSM.SINGLE_LINE, oem=tesserocr.OEM.LSTM_ONLY, **kwargs)
+                logging.info("Tesseract API engine initialized (tesserocr).")
+            except Exception as e:
+                self._api_failed = True
+                log = logging.error if self.mode == 'api' else logging.info
+                log(f"Tesseract API engine not available ({e}). Using the tesseract executable.")
+        return self._api
+
+    def active_engine(self):
+        """Returns the engine the next read() will use: 'api' or 'cli'. Part of the OCR result cache key."""
+        with self._lock:
+            return 'api' if self._get_api() is not None else 'cli'
+
+    def read(self, image, profile_name='default'):
+        """Returns the text Tesseract reads in a preprocessed (binary) image."""
+        start = time.perf_counter()
+        with self._lock:
+            api = self._get_api()
+            if api is not None:
+                engine = 'api'
+                image = np.ascontiguousarray(image)
+                api.SetImageBytes(image.tobytes(), image.shape[1], image.shape[0], 1, image.strides[0])
+                text = api.GetUTF8Text()
+        if api is None:
+            engine = 'cli'
+            text = ce_backends.get('pytesseract').image_to_string(image, config=TESSERACT_CONFIG)
+        elapsed = time.perf_counter() - start
+        stats = self.stats.setdefault((engine, profile_name), {'calls': 0, 'total': 0.0, 'max': 0.0})
+        stats['calls'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        logging.debug(f"Tesseract ({engine}, profile '{profile_name}') took {elapsed * 1000:.0f} ms.")
+        return text.strip()
+
+    def summary(self):
+        if not self.stats: return "no Tesseract calls recorded"
+        return "; ".join(f"{engine}/{profile}: {s['calls']} calls, average {s['total'] / s['calls'] * 1000:.0f} ms, "
+                         f"longest {s['max'] * 1000:.0f} ms" for (engine, profile), s in sorted(self.stats.items()))
+
+TESSERACT = TesseractEngine(TESSERACT_ENGINE)
+
+class OcrResultCache:
+    """
+    Remembers what OCR read in a screen region, keyed by a hash of the region's pixels plus the engine
+    and preprocessing settings. Static labels are read once; a later check of identical pixels skips OCR.
+    The cache keeps the max_entries most recently used results. With persist=True it is stored in
+    cache/ocr_results.json, so a warm cache survives restarts.
+    """
+    SAVE_INTERVAL = 60 # seconds between writes of a changed cache file
+
+    def __init__(self, max_entries=2000, persist=False, cache_dir=CACHE_DIR):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.path = os.path.join(cache_dir, "ocr_results.json")
+        self._entries = OrderedDict() # key -> text (Tesseract) or list of texts (EasyOCR)
+        self._loaded = not persist
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(region, settings):
+        """Returns the cache key of a region for an engine/preprocessing description."""
+        digest = hashlib.blake2b(np.ascontiguousarray(region).data, digest_size=16)
+        digest.update(str(region.shape).encode())
+        return f"{settings}|{digest.hexdigest()}"
+
+    def _load(self):
+        """Reads the persisted cache on first use. Call with the lock held."""
+        self._loaded = True
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries.update(json.load(f))
+            logging.info(f"Loaded {len(self._entries)} cached OCR results from '{self.path}'.")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read OCR cache '{self.path}': {e}. Starting with an empty cache.")
+
+    def get(self, key):
+        with self._lock:
+            if not self._loaded: self._load()
+            value = self._entries.get(key)
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if not self._loaded: self._load()
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            save_due = self.persist and time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+        if save_due: self.save()
+
+    def save(self):
+        """Writes the cache file if persistence is on and the cache changed since the last save."""
+        with self._lock:
+            if not (self.persist and self._dirty): return
+            entries = dict(self._entries)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        # Parallel workers share the file, so each one writes its own temporary file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save OCR cache '{self.path}': {e}")
+
+    def summary(self):
+        looked_up = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / looked_up if looked_up else 0.0
+        return (f"{self.stats['hits']} hits, {self.stats['misses']} misses (hit rate {hit_rate:.0%}), "
+                f"{len(self._entries)} results cached")
+
+OCR_CACHE_ENABLED = general_config.get('ocr_cache', True)
+OCR_CACHE = OcrResultCache(general_config.get('ocr_cache_size', 2000), general_config.get('ocr_cache_persist', False))
+atexit.register(OCR_CACHE.save)
+
+def ocr_summary():
+    summary = f"Tesseract latency: {TESSERACT.summary()}"
+    if OCR_CACHE_ENABLED: summary += f". OCR result cache: {OCR_CACHE.summary()}"
+    return summary
@@ -0,0 +1,270 @@
+import os
+import sys
+import secrets
+import atexit
+import time
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from ce_config import load_general_config
+import ce_backends
+
+general_config = load_general_config()
+OCR_SERVICE_ENABLED = general_config.get('ocr_service', True)
+OCR_SERVICE_ADDRESS = ('127.0.0.1', general_config.get('ocr_service_port', 6150))
+OCR_SERVICE_MAX_MEMORY_MB = general_config.get('ocr_service_max_memory_mb', 4096)
+# Connections authenticate with a random key kept in cache/ocr_service.key, readable only by its owner.
+# Requests are Python objects that the service unpickles, so any process that can read the key
+# (every process of the user running the robot) is fully trusted by the service.
+AUTHKEY_PATH = os.path.join("cache", "ocr_service.key")
+AUTHKEY_SIZE = 32
+_authkey = None
+_authkey_lock = threading.Lock()
+
+def get_authkey(path=AUTHKEY_PATH):
+    """Returns the key of this computer's OCR service, creating it on first use."""
+    global _authkey
+    with _authkey_lock:
+        if _authkey is None: _authkey = _load_or_create_authkey(path)
+        return _authkey
+
+def _load_or_create_authkey(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        # O_EXCL: when several processes start at once, exactly one creates the key
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600)
+    except FileExistsError:
+        pass
+    else:
+        key = secrets.token_bytes(AUTHKEY_SIZE)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        logging.info(f"Created OCR service key '{path}'.")
+        return key
+    deadline = time.monotonic() + 5
+    while True: # The process that created the file may still be writing the key
+        with open(path, 'rb') as f:
+            key = f.read()
+        if len(key) >= AUTHKEY_SIZE: return key
+        if time.monotonic() >= deadline:
+            raise OcrServiceError(f"OCR service key '{path}' is invalid. Delete it to create a new one.")
+        time.sleep(0.05)
+
+class OcrServiceError(RuntimeError):
+    pass
+
+# --- Service side ---
+
+def _setup_service_logging():
+    logger = logging.getLogger()
+    for handler in logger.handlers[:]: logger.removeHandler(handler)
+    os.makedirs('logs', exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s - [OCR service] %(levelname)s - %(message)s')
+    for handler in (logging.FileHandler(f"logs/CE_ocr_service_{time.strftime('%Y-%m-%d_%H-%M-%S')}.log"), logging.StreamHandler(sys.stdout)):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.setLevel(getattr(logging, general_config.get('log_level', 'INFO'), logging.INFO))
+
+def _read_shared_image(request):
+    """Copies the image a client placed in shared memory."""
+    try:
+        # The client owns the block, so the service must not clean it up (track=False exists since Python 3.13)
+        block = shared_memory.SharedMemory(name=request['shm'], track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=request['shm'])
+    try:
+        return np.ndarray(request['shape'], dtype=request['dtype'], buffer=block.buf).copy()
+    finally:
+        block.close()
+
+class _ReaderPool:
+    """The EasyOCR readers of the service, one per language, created once and shared by all connections."""
+    def __init__(self):
+        self._readers = {}
+        self._lock = threading.Lock() # EasyOCR readers are not safe to use from several threads
+
+    def readtext(self, language, image):
+        with self._lock:
+            if language not in self._readers:
+                logging.info(f"Loading EasyOCR reader for '{language}'...")
+                start = time.perf_counter()
+                self._readers[language] = ce_backends.get('easyocr').Reader([language])
+                logging.info(f"EasyOCR reader for '{language}' loaded in {time.perf_counter() - start:.1f}s.")
+            if image is None: return None
+            return self._readers[language].readtext(image)
+
+    def languages(self):
+        return sorted(self._readers)
+
+def run_service(languages, address=OCR_SERVICE_ADDRESS, max_memory_mb=OCR_SERVICE_MAX_MEMORY_MB, authkey=None):
+    """
+    Entry point of the OCR service process. Listens on a local socket and runs EasyOCR for any number
+    of robot processes. Readers for 'languages' are loaded in the background right after start-up.
+    The process exits when its memory grows beyond max_memory_mb, and the next client starts a fresh one.
+    authkey is the key clients must know (the client that starts the service passes its own).
+    """
+    _setup_service_logging()
+    authkey = authkey or get_authkey()
+    try:
+        listener = Listener(address, authkey=authkey)
+    except OSError as e:
+        logging.info(f"OCR service not started, {address[0]}:{address[1]} is already in use ({e}). Another service is probably running.")
+        return
+    logging.info(f"OCR service listening on {address[0]}:{address[1]} (PID {os.getpid()}).")
+    readers = _ReaderPool()
+    stop = threading.Event()
+
+    def preload():
+        for language in languages:
+            try:
+                readers.readtext(language, None)
+            except Exception as e:
+                logging.error(f"Could not preload EasyOCR reader for '{language}': {e}")
+    threading.Thread(target=preload, daemon=True).start()
+
+    def handle(conn):
+        with conn:
+            while not stop.is_set():
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                op = request.get('op')
+                if op == 'readtext':
+                    try:
+                        results = readers.readtext(request['language'], _read_shared_image(request))
+                        response = {'ok': True, 'results': [(np.asarray(bbox).tolist(), text, float(prob)) for bbox, text, prob in results]}
+                    except Exception as e:
+                        logging.error(f"EasyOCR request failed: {e}")
+                        response = {'ok': False, 'error': str(e)}
+                elif op == 'ping':
+                    response = {'ok': True, 'pid': os.getpid(), 'languages': readers.languages(), 'memory_mb': ce_backends.memory_usage_mb()}
+                else:
+                    response = {'ok': False, 'error': f"Unknown request '{op}'."}
+                try:
+                    conn.send(response)
+                except OSError:
+                    return
+                memory_mb = ce_backends.memory_usage_mb()
+                if memory_mb > max_memory_mb and not stop.is_set():
+                    logging.warning(f"OCR service uses {memory_mb:.0f} MB (limit {max_memory_mb} MB). Exiting so a fresh service can take over.")
+                    stop.set()
+                    try:
+                        Client(address, authkey=authkey).close() # Wakes up the accept() loop
+                    except OSError:
+                        pass
+
+    while not stop.is_set():
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+            logging.warning(f"Rejected OCR service connection: {e}"); continue
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    listener.close()
+    logging.info("OCR service stopped.")
+
+# --- Client side ---
+
+class OcrServiceClient:
+    """
+    Sends EasyOCR requests to the OCR service. The image is passed through a shared memory block that
+    the client reuses between calls; only its name and shape travel over the socket.
+    If the service is not running (or was recycled), it is started and the request is sent again.
+    """
+    CONNECT_TIMEOUT = 30 # seconds to wait for a newly started service to listen
+
+    def __init__(self, address=OCR_SERVICE_ADDRESS):
+        self.address = address
+        self._conn = None
+        self._block = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            return Client(self.address, authkey=get_authkey())
+        except multiprocessing.AuthenticationError as e:
+            raise OcrServiceError(f"The process on {self.address[0]}:{self.address[1]} did not accept the key in '{AUTHKEY_PATH}' ({e}). "
+                                  f"Stop it or change ocr_service_port.") from e
+
+    def start(self, languages):
+        """Starts the service in a child process, unless one is already reachable."""
+        try:
+            self._open().close()
+            logging.info(f"Using the OCR service already running on {self.address[0]}:{self.address[1]}.")
+            return
+        except OSError:
+            pass
+        except OcrServiceError as e:
+            logging.warning(f"OCR service not started: {e}"); return
+        logging.info(f"Starting OCR service with EasyOCR readers for {sorted(languages)}...")
+        self._process = multiprocessing.Process(target=run_service, args=(sorted(languages), self.address, OCR_SERVICE_MAX_MEMORY_MB, get_authkey()), name="CE-OCR-Service", daemon=True)
+        self._process.start()
+
+    def _connect(self, language):
+        try:
+            return self._open()
+        except OSError:
+            self.start([language])
+        deadline = time.monotonic() + self.CONNECT_TIMEOUT
+        while True:
+            try:
+                return self._open()
+            except OSError as e:
+                if time.monotonic() >= deadline: raise OcrServiceError(f"Could not connect to the OCR service: {e}")
+                time.sleep(0.5)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _shared_image(self, image):
+        if self._block is None or self._block.size < image.nbytes:
+            self._release_block()
+            self._block = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1 << 20))
+        np.ndarray(image.shape, dtype=image.dtype, buffer=self._block.buf)[:] = image
+        return self._block.name
+
+    def _release_block(self):
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def _request(self, language, image, timeout):
+        if self._conn is None: self._conn = self._connect(language)
+        self._conn.send({'op': 'readtext', 'language': language, 'shm': self._shared_image(image), 'shape': image.shape, 'dtype': str(image.dtype)})
+        if not self._conn.poll(timeout): raise OcrServiceError(f"The OCR service did not answer within {timeout}s.")
+        response = self._conn.recv()
+        if not response.get('ok'): raise OcrServiceError(f"The OCR service failed: {response.get('error')}")
+        return response['results']
+
+    def readtext(self, language, image, timeout=300):
+        """
+        Returns the EasyOCR results [(bbox, text, confidence), ...] for an image.
+        The generous default timeout covers the first request, which may wait for the model to load.
+        Raises OcrServiceError if the service cannot be reached or fails.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    return self._request(language, image, timeout)
+                except (OSError, EOFError) as e:
+                    self._close()
+                    if attempt == 2: raise OcrServiceError(f"The OCR service is not available: {e}")
+                    logging.info(f"OCR service connection lost ({e}). Reconnecting.")
+                except OcrServiceError:
+                    self._close()
+                    raise
+
+    def close(self):
+        with self._lock:
+            self._close()
+            self._release_block()
+
+OCR_SERVICE = OcrServiceClient()
+atexit.register(OCR_SERVICE.close)
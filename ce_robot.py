@@ -1,33 +1,49 @@
 import logging
 import time
+# Taken before the project imports below, so the startup report includes them
+STARTUP_BEGIN = time.perf_counter()
 import os
 import sys
 import threading
 import argparse
-import yaml
+import queue
+import multiprocessing
 from datetime import datetime
-from ce_config import load_instances, load_emulator_type, connect_adb_to_instance, load_run_order, load_general_config, load_hotkey_config, load_workflow_sets
-from ce_launcher import launch_instance, terminate_instance
+from ce_config import load_instances, load_emulator_type, connect_adb_to_instance, load_run_order, load_general_config, load_hotkey_config, load_workflow_sets, load_parallel_instances
+from ce_launcher import launch_instance, terminate_instance, wait_for_instance_ready, format_timings
 from ce_workflow_engine import WorkflowEngine
 import ce_actions
+import ce_templates
+import ce_backends
+import ce_ocr
+from ce_workflows import WORKFLOWS, workflow_path
+from ce_ocr_service import OCR_SERVICE, OCR_SERVICE_ENABLED
+from ce_hints import HINTS
+from ce_debug_images import DEBUG_IMAGES
+from ce_notify import NOTIFIER, EXIT_TIMEOUT as NOTIFY_EXIT_TIMEOUT
 from ce_hotkeys import setup_hotkey_listener
 
 # Global threading events for hotkeys
 pause_event = threading.Event()
 stop_event = threading.Event()
 
-def setup_logging(log_level_str='INFO'):
+MAX_LAUNCH_ATTEMPTS = 3
+
+def setup_logging(log_level_str='INFO', instance_name=None):
     log_level = getattr(logging, log_level_str.upper(), logging.INFO)
     logger = logging.getLogger()
     logger.setLevel(log_level)
     for handler in logger.handlers[:]: logger.removeHandler(handler)
     if not os.path.exists('logs'): os.makedirs('logs')
-    log_filename = f"logs/CE_robot_{time.strftime('%Y-%m-%d_%H-%M-%S')}.log"
+    # Parallel workers write one log file per instance
+    log_suffix = f"_{instance_name}" if instance_name else ""
+    log_filename = f"logs/CE_robot_{time.strftime('%Y-%m-%d_%H-%M-%S')}{log_suffix}.log"
     file_handler = logging.FileHandler(log_filename)
     file_handler.setLevel(log_level)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(log_level)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    log_format = f'%(asctime)s - [{instance_name}] %(levelname)s - %(message)s' if instance_name else '%(asctime)s - %(levelname)s - %(message)s'
+    formatter = logging.Formatter(log_format)
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
@@ -43,28 +59,225 @@ def check_for_pause_or_stop():
         logging.critical("Emergency stop signal received. Terminating script.")
         sys.exit("Emergency stop activated by user.")
 
+def process_instance(name, details, emulator_type, workflows_to_run, workflow_file=None):
+    """
+    Launches one instance, verifies the game screen, runs the workflows on it and terminates it.
+    Returns a result dict for the run summary.
+    """
+    general_settings = load_general_config()
+    emulator_boot_time = general_settings.get('emulator_boot_time')
+    check_image = general_settings.get("game_load_check_image")
+    check_threshold = general_settings.get("game_load_check_threshold")
+
+    result = {'instance': name, 'status': 'skipped', 'duration': None, 'workflows': 0, 'boot_timings': None}
+    command = details.get(f"{emulator_type}_command")
+    language = details.get("language")
+    
+    if not command:
+        logging.warning(f"Skipping instance '{name}' - No command found for emulator type '{emulator_type}'.")
+        return result
+
+    instance_ready, final_process, final_adb_id = False, None, None
+    
+    for attempt in range(1, MAX_LAUNCH_ATTEMPTS + 1):
+        check_for_pause_or_stop()
+        logging.info(f"--- Processing instance: {name} (Attempt {attempt}/{MAX_LAUNCH_ATTEMPTS}) ---")
+        process, adb_id = None, None
+        try:
+            process = launch_instance(name, command)
+            if not process: continue
+            if general_settings.get('readiness_polling'):
+                adb_id, timings, failed_stage = wait_for_instance_ready(name, language, general_settings, on_poll=check_for_pause_or_stop)
+                result['boot_timings'] = timings
+                if failed_stage is None:
+                    instance_ready, final_process, final_adb_id = True, process, adb_id
+                    break
+                ce_actions.send_email(f"CE Automation: {name} Failed Verification", f"Instance '{name}' did not pass readiness stage '{failed_stage}' on attempt {attempt} ({format_timings(timings)}).")
+                terminate_instance(process, adb_id if failed_stage != 'adb' else None)
+                time.sleep(15)
+                continue
+            logging.info(f"Waiting {emulator_boot_time}s for emulator boot...")
+            time.sleep(emulator_boot_time)
+            check_for_pause_or_stop()
+            adb_id = connect_adb_to_instance(name, logger=logging)
+            
+            if not adb_id:
+                terminate_instance(process, adb_id)
+                time.sleep(15)
+                continue
+            
+            logging.info(f"Successfully connected ADB to {adb_id}. Verifying game screen...")
+            
+            is_loaded = False
+            if check_image:
+                if ce_actions.get_coords_from_image(adb_id, language, name, "Startup_Check", check_image, check_threshold):
+                    logging.info("Game load verification successful (Image Found).")
+                    is_loaded = True
+                else:
+                    logging.warning(f"Image-based verification FAILED for '{check_image}'.")
+            else:
+                logging.info("Global game load verification image not configured. Skipping check.")
+                is_loaded = True
+
+            if is_loaded:
+                instance_ready, final_process, final_adb_id = True, process, adb_id
+                break
+            else:
+                ce_actions.send_email(f"CE Automation: {name} Failed Verification", f"Instance '{name}' failed game load check on attempt {attempt}.")
+                terminate_instance(process, adb_id)
+                time.sleep(15)
+        except Exception as e:
+            logging.error(f"Unexpected error during launch of {name}: {e}", exc_info=True)
+            if process: terminate_instance(process, adb_id)
+    
+    if instance_ready:
+        start_time = datetime.now()
+        try:
+            engine = WorkflowEngine(final_adb_id, language, name, workflow_file=workflow_file)
+            logging.info(f"--- Starting all workflows for instance '{name}' ---")
+            result['status'] = 'running'
+            for workflow_name in workflows_to_run:
+                check_for_pause_or_stop()
+                engine.run_workflow(workflow_name)
+                result['workflows'] += 1
+            result['status'] = 'completed'
+            duration = datetime.now() - start_time
+            logging.info(f"--- Workflows for '{name}' completed. Duration: {str(duration).split('.')[0]} ---")
+            logging.info(f"Location hint stats so far: {HINTS.summary()}")
+            logging.info(f"Screen settle stats so far: {ce_actions.settle_summary()}")
+            logging.info(f"OCR stats so far: {ce_ocr.ocr_summary()}")
+            if ce_actions.SAVE_DEBUG_IMAGES: logging.info(f"Debug images so far: {DEBUG_IMAGES.summary()}")
+            logging.info(f"Notifications so far: {NOTIFIER.summary()}")
+        except Exception as e:
+            result['status'] = 'workflow error'
+            logging.error(f"Error during workflow execution for {name}: {e}", exc_info=True)
+        finally:
+            if result['status'] == 'running': result['status'] = 'stopped'
+            result['duration'] = datetime.now() - start_time
+            logging.info(f"--- Finished processing instance {name}. Terminating. ---")
+            if final_process: terminate_instance(final_process, final_adb_id)
+    else:
+        result['status'] = 'launch failed'
+        logging.critical(f"--- FAILED to launch and verify instance {name} after {MAX_LAUNCH_ATTEMPTS} attempts. Skipping. ---")
+        ce_actions.send_email(f"CE Automation FAILURE: {name} Could Not Launch", f"Failed to launch '{name}' after {MAX_LAUNCH_ATTEMPTS} attempts.")
+    return result
+
+def _instance_worker(name, details, emulator_type, workflows_to_run, workflow_file, log_level, worker_pause_event, worker_stop_event, result_queue):
+    """Entry point of a worker process in parallel mode. Runs one instance and reports its result."""
+    global pause_event, stop_event
+    pause_event, stop_event = worker_pause_event, worker_stop_event
+    setup_logging(log_level, instance_name=name)
+    # Each worker gets its own folder for temporary screenshots
+    ce_actions.TEMP_DIR = os.path.join("temp", name)
+    os.makedirs(ce_actions.TEMP_DIR, exist_ok=True)
+    result = {'instance': name, 'status': 'error', 'duration': None, 'workflows': 0, 'boot_timings': None}
+    try:
+        ce_templates.preload(details.get("language"))
+        result = process_instance(name, details, emulator_type, workflows_to_run, workflow_file)
+    except SystemExit as e:
+        result['status'] = 'stopped'
+        logging.info(f"Worker for '{name}' exiting: {e}")
+    except Exception as e:
+        logging.critical(f"A critical error occurred in the worker for '{name}': {e}", exc_info=True)
+    finally:
+        DEBUG_IMAGES.flush()
+        NOTIFIER.flush(NOTIFY_EXIT_TIMEOUT)
+        result_queue.put(result)
+
+def run_instances_in_parallel(jobs, max_workers, emulator_type, workflows_to_run, workflow_file, log_level):
+    """
+    Runs each (name, details) job in its own process, with at most max_workers alive at a time.
+    A worker that dies without reporting a result is recorded as crashed; the other workers keep running.
+    """
+    logging.info(f"Running {len(jobs)} instances with up to {max_workers} parallel workers.")
+    result_queue = multiprocessing.Queue()
+    pending, running, results = list(jobs), {}, {}
+
+    def collect_results():
+        while True:
+            try: result = result_queue.get_nowait()
+            except queue.Empty: return
+            results[result['instance']] = result
+
+    while pending or running:
+        while pending and len(running) < max_workers and not stop_event.is_set():
+            name, details = pending.pop(0)
+            worker = multiprocessing.Process(target=_instance_worker, name=f"CE-{name}",
+                                             args=(name, details, emulator_type, workflows_to_run, workflow_file, log_level, pause_event, stop_event, result_queue))
+            worker.start()
+            running[name] = (worker, datetime.now())
+            logging.info(f"Started worker for instance '{name}' (PID {worker.pid}).")
+        if stop_event.is_set() and pending:
+            logging.warning(f"Emergency stop received. Not starting {len(pending)} remaining instances.")
+            pending.clear()
+        try:
+            result = result_queue.get(timeout=1)
+            results[result['instance']] = result
+        except queue.Empty:
+            pass
+        for name, (worker, started) in list(running.items()):
+            if worker.is_alive(): continue
+            worker.join()
+            collect_results()
+            if name not in results:
+                logging.error(f"Worker for instance '{name}' crashed with exit code {worker.exitcode}.")
+                results[name] = {'instance': name, 'status': f"crashed (exit code {worker.exitcode})", 'duration': datetime.now() - started, 'workflows': 0, 'boot_timings': None}
+            else:
+                logging.info(f"Worker for instance '{name}' finished: {results[name]['status']}.")
+            del running[name]
+    return [results[name] for name, _ in jobs if name in results]
+
+def start_ocr_service(jobs, workflow_file=None):
+    """
+    Starts the shared EasyOCR service before any instance runs, with readers for every language whose
+    workflow file uses compare_with_text_easyocr. All instances of the run then share the loaded models.
+    """
+    if not OCR_SERVICE_ENABLED: return
+    ocr_languages = []
+    for language in sorted({details.get("language") for _, details in jobs}):
+        try:
+            with open(workflow_path(language, workflow_file), 'r', encoding='utf-8') as f:
+                if 'compare_with_text_easyocr' in f.read(): ocr_languages.append(language)
+        except OSError:
+            continue
+    if ocr_languages:
+        OCR_SERVICE.start(ocr_languages)
+
+def log_run_summary(results):
+    if not results: return
+    logging.info("=== Run summary ===")
+    for result in results:
+        duration = str(result['duration']).split('.')[0] if result['duration'] else "-"
+        boot = f", boot {format_timings(result['boot_timings'])}" if result.get('boot_timings') else ""
+        logging.info(f"{result['instance']}: {result['status']}, {result['workflows']} workflows, duration {duration}{boot}")
+    completed = sum(1 for result in results if result['status'] == 'completed')
+    logging.info(f"{completed}/{len(results)} instances completed successfully.")
+
 def main():
     """Main function to execute emulator instance automation."""
     parser = argparse.ArgumentParser(description="Clone Evolution automation robot.")
     parser.add_argument("instance_names", nargs='*', help="One or more instance names to run (e.g., 'CE_2024_1'). Overrides run order from config.")
     parser.add_argument("-wf", "--workflow-file", default=None, help="Path to a custom YAML workflow file to run instead of the default.")
+    parser.add_argument("-j", "--parallel", type=int, default=None, help="Number of instances to run at the same time. Overrides 'parallel_instances' from config.")
     args = parser.parse_args()
 
     general_settings = load_general_config()
     hotkeys_config = load_hotkey_config()
     log_level = general_settings.get('log_level')
-    emulator_boot_time = general_settings.get('emulator_boot_time')
-    
-    check_image = general_settings.get("game_load_check_image")
-    check_threshold = general_settings.get("game_load_check_threshold")
+    parallel_instances = max(1, args.parallel if args.parallel is not None else load_parallel_instances())
     
     setup_logging(log_level)
+    logging.info(ce_backends.startup_report(STARTUP_BEGIN))
+    
+    if parallel_instances > 1:
+        # Worker processes need events that are shared across processes
+        global pause_event, stop_event
+        pause_event, stop_event = multiprocessing.Event(), multiprocessing.Event()
     
     hotkey_thread = threading.Thread(target=setup_hotkey_listener, args=(pause_event, stop_event, hotkeys_config), daemon=True)
     hotkey_thread.start()
     
-    MAX_LAUNCH_ATTEMPTS = 3
-    
+    results = []
     try:
         check_for_pause_or_stop()
         emulator_type = load_emulator_type()
@@ -98,98 +311,34 @@ def main():
         # Determine the final list of workflows to run for ALL instances
         workflows_to_run = []
         if args.workflow_file:
-            if not os.path.exists(args.workflow_file):
-                logging.error(f"Custom workflow file not found at path: {args.workflow_file}")
-                sys.exit(1)
-            try:
-                with open(args.workflow_file, 'r') as f:
-                    data = yaml.safe_load(f)
-                    workflows_to_run = [s['name'] for s in data.get('scenarios', [])]
-                logging.info(f"Using custom workflow file: '{args.workflow_file}' with workflows: {workflows_to_run}")
-            except Exception as e:
-                logging.error(f"Could not load/parse custom workflow file '{args.workflow_file}': {e}. Aborting.")
+            workflows_to_run = WORKFLOWS.scenario_names(args.workflow_file)
+            if workflows_to_run is None:
+                logging.error(f"Could not use custom workflow file '{args.workflow_file}'. Aborting.")
                 sys.exit(1)
+            logging.info(f"Using custom workflow file: '{args.workflow_file}' with workflows: {workflows_to_run}")
         elif active_set and active_set.lower() in all_workflow_sets:
             workflows_to_run = all_workflow_sets[active_set]
             logging.info(f"Using '{active_set}' workflow set: {workflows_to_run}")
         else:
             logging.warning(f"No valid 'active_set' configured in [RunOrder] or no workflows found. No default workflows will be run.")
 
+        jobs = []
         for name in execution_list:
-            check_for_pause_or_stop()
             if name not in all_instances:
                 logging.warning(f"Instance '{name}' from run order not found in instance definitions. Skipping.")
                 continue
-            
-            details = all_instances[name]
-            command = details.get(f"{emulator_type}_command")
-            language = details.get("language")
-            
-            if not command:
-                logging.warning(f"Skipping instance '{name}' - No command found for emulator type '{emulator_type}'.")
-                continue
+            jobs.append((name, all_instances[name]))
 
-            instance_ready, final_process, final_adb_id = False, None, None
-            
-            for attempt in range(1, MAX_LAUNCH_ATTEMPTS + 1):
+        start_ocr_service(jobs, args.workflow_file)
+
+        if parallel_instances > 1 and len(jobs) > 1:
+            results = run_instances_in_parallel(jobs, parallel_instances, emulator_type, workflows_to_run, args.workflow_file, log_level)
+        else:
+            for language in sorted({details.get("language") for _, details in jobs}):
+                ce_templates.preload(language)
+            for name, details in jobs:
                 check_for_pause_or_stop()
-                logging.info(f"--- Processing instance: {name} (Attempt {attempt}/{MAX_LAUNCH_ATTEMPTS}) ---")
-                process, adb_id = None, None
-                try:
-                    process = launch_instance(name, command)
-                    if not process: continue
-                    logging.info(f"Waiting {emulator_boot_time}s for emulator boot...")
-                    time.sleep(emulator_boot_time)
-                    check_for_pause_or_stop()
-                    adb_id = connect_adb_to_instance(name, logger=logging)
-                    
-                    if not adb_id:
-                        terminate_instance(process, adb_id)
-                        time.sleep(15)
-                        continue
-                    
-                    logging.info(f"Successfully connected ADB to {adb_id}. Verifying game screen...")
-                    
-                    is_loaded = False
-                    if check_image:
-                        if ce_actions.get_coords_from_image(adb_id, language, name, "Startup_Check", check_image, check_threshold):
-                            logging.info("Game load verification successful (Image Found).")
-                            is_loaded = True
-                        else:
-                            logging.warning(f"Image-based verification FAILED for '{check_image}'.")
-                    else:
-                        logging.info("Global game load verification image not configured. Skipping check.")
-                        is_loaded = True
-
-                    if is_loaded:
-                        instance_ready, final_process, final_adb_id = True, process, adb_id
-                        break
-                    else:
-                        ce_actions.send_email(f"CE Automation: {name} Failed Verification", f"Instance '{name}' failed game load check on attempt {attempt}.")
-                        terminate_instance(process, adb_id)
-                        time.sleep(15)
-                except Exception as e:
-                    logging.error(f"Unexpected error during launch of {name}: {e}", exc_info=True)
-                    if process: terminate_instance(process, adb_id)
-            
-            if instance_ready:
-                try:
-                    engine = WorkflowEngine(final_adb_id, language, name, workflow_file=args.workflow_file)
-                    start_time = datetime.now()
-                    logging.info(f"--- Starting all workflows for instance '{name}' ---")
-                    for workflow_name in workflows_to_run:
-                        check_for_pause_or_stop()
-                        engine.run_workflow(workflow_name)
-                    duration = datetime.now() - start_time
-                    logging.info(f"--- Workflows for '{name}' completed. Duration: {str(duration).split('.')[0]} ---")
-                except Exception as e:
-                    logging.error(f"Error during workflow execution for {name}: {e}", exc_info=True)
-                finally:
-                    logging.info(f"--- Finished processing instance {name}. Terminating. ---")
-                    if final_process: terminate_instance(final_process, final_adb_id)
-            else:
-                logging.critical(f"--- FAILED to launch and verify instance {name} after {MAX_LAUNCH_ATTEMPTS} attempts. Skipping. ---")
-                ce_actions.send_email(f"CE Automation FAILURE: {name} Could Not Launch", f"Failed to launch '{name}' after {MAX_LAUNCH_ATTEMPTS} attempts.")
+                results.append(process_instance(name, details, emulator_type, workflows_to_run, args.workflow_file))
     
     except SystemExit as e:
         logging.info(f"Script exiting cleanly: {e}")
@@ -197,7 +346,12 @@ def main():
         logging.critical(f"A critical error occurred in the main script: {e}", exc_info=True)
     
     finally:
+        log_run_summary(results)
+        NOTIFIER.flush(NOTIFY_EXIT_TIMEOUT)
+        logging.info(f"Notifications: {NOTIFIER.summary()}")
+        logging.info(f"Heavy backends loaded during the run: {ce_backends.loaded_summary()} (process memory {ce_backends.memory_usage_mb():.0f} MB)")
         logging.info("Script finished.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+import cv2
+from ce_config import load_general_config
+from ce_templates import RESOURCES_DIR
+
+SCREENS_DIR = "screens" # Reference screenshots live in resources/<language>/screens/
+THUMBNAIL_SIZE = (32, 18) # (width, height) of the signature thumbnail, 16:9 like the emulator screen
+UNKNOWN_SCREEN = "unknown"
+
+def screen_signature(gray_img):
+    """
+    Returns the signature of a grayscale screenshot: a tiny thumbnail, zero-mean and scaled to unit length,
+    so comparing two signatures is a dot product that ignores overall brightness and contrast.
+    """
+    thumb_w, thumb_h = THUMBNAIL_SIZE
+    # Striding first keeps the resize cheap on full-size frames
+    step = max(1, min(gray_img.shape[0] // (thumb_h * 4), gray_img.shape[1] // (thumb_w * 4)))
+    thumb = cv2.resize(gray_img[::step, ::step], THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    norm = np.linalg.norm(thumb)
+    return thumb / norm if norm > 0 else thumb
+
+class ScreenClassifier:
+    """
+    Names the screen that is currently shown by comparing a thumbnail signature of the frame with the
+    signatures of reference screenshots in resources/<language>/screens/. Each file is named after the
+    screen it shows (main.png, guild.png, ...). Several references for the same screen can be added as
+    <screen>@<variant>.png, e.g. main@event.png.
+    The references are reloaded when files are added, removed or edited in that folder.
+    """
+    RELOAD_CHECK_INTERVAL = 5 # seconds between checks of the reference folder
+
+    def __init__(self, resources_dir=RESOURCES_DIR, threshold=0.9):
+        self.resources_dir = resources_dir
+        self.threshold = threshold
+        self._signatures = {} # language -> (folder state, [screen names], signature matrix)
+        self._last_check = {} # language -> time.monotonic() of the last folder check
+        self._lock = threading.Lock()
+
+    def folder(self, language):
+        return os.path.join(self.resources_dir, language, SCREENS_DIR)
+
+    def _folder_state(self, language):
+        folder = self.folder(language)
+        try:
+            return tuple(sorted((entry.name, entry.stat().st_mtime) for entry in os.scandir(folder) if entry.name.lower().endswith('.png')))
+        except OSError:
+            return ()
+
+    def _load(self, language, state):
+        names, signatures = [], []
+        for filename, _ in state:
+            image = cv2.imread(os.path.join(self.folder(language), filename), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                logging.warning(f"Reference screenshot '{filename}' in {self.folder(language)} is unreadable. Ignoring it."); continue
+            names.append(os.path.splitext(filename)[0].split('@')[0])
+            signatures.append(screen_signature(image))
+        matrix = np.vstack(signatures) if signatures else np.empty((0, THUMBNAIL_SIZE[0] * THUMBNAIL_SIZE[1]), np.float32)
+        logging.info(f"Loaded {len(names)} reference screenshots for '{language}' ({', '.join(sorted(set(names))) or 'none'}).")
+        return state, names, matrix
+
+    def _references(self, language):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._signatures.get(language)
+            if cached and now - self._last_check.get(language, 0) < self.RELOAD_CHECK_INTERVAL:
+                return cached
+            self._last_check[language] = now
+        state = self._folder_state(language)
+        if cached and cached[0] == state: return cached
+        loaded = self._load(language, state)
+        with self._lock:
+            self._signatures[language] = loaded
+        return loaded
+
+    def screen_names(self, language):
+        """Returns the names of the screens that have reference screenshots."""
+        return sorted(set(self._references(language)[1]))
+
+    def classify(self, language, gray_img):
+        """Returns (screen name, similarity) for a grayscale frame. The name is 'unknown' if no reference is similar enough."""
+        _, names, matrix = self._references(language)
+        if not names: return UNKNOWN_SCREEN, 0.0
+        scores = matrix @ screen_signature(gray_img)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        return (names[best] if score >= self.threshold else UNKNOWN_SCREEN), score
+
+    def save_reference(self, language, name, image):
+        """Saves a screenshot as a reference for a screen and returns its path."""
+        os.makedirs(self.folder(language), exist_ok=True)
+        path = os.path.join(self.folder(language), f"{name}.png")
+        cv2.imwrite(path, image)
+        with self._lock:
+            self._last_check.pop(language, None)
+        return path
+
+general_config = load_general_config()
+SCREENS = ScreenClassifier(threshold=general_config.get('screen_match_threshold', 0.9))
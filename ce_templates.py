@@ -0,0 +1,196 @@
+import os
+import atexit
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+import cv2
+from ce_config import load_general_config
+
+RESOURCES_DIR = "resources"
+CACHE_DIR = "cache"
+
+class TemplateStore:
+    """
+    Process-wide cache of the template images in resources/<language>/.
+    Each template is read from disk once per variant (color BGR or grayscale) and kept in an LRU cache.
+    The file's modification time is checked on every lookup, so an edited template is picked up
+    without restarting the script.
+    """
+    def __init__(self, resources_dir=RESOURCES_DIR, max_entries=256):
+        self.resources_dir = resources_dir
+        self.max_entries = max_entries
+        self._cache = OrderedDict() # (path, grayscale) -> (mtime, image)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'loads': 0}
+
+    def path(self, language, image_name):
+        return os.path.join(self.resources_dir, language, image_name)
+
+    def get(self, language, image_name, grayscale=False):
+        """
+        Returns the template as a read-only numpy array, or None if the file is missing or unreadable.
+        """
+        template_path = self.path(language, image_name)
+        try:
+            mtime = os.stat(template_path).st_mtime
+        except OSError:
+            return None
+        key = (template_path, grayscale)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == mtime:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached[1]
+        template_img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+        if template_img is None:
+            return None
+        template_img.flags.writeable = False
+        with self._lock:
+            if cached:
+                logging.debug(f"Template '{template_path}' changed on disk. Reloaded.")
+            self._cache[key] = (mtime, template_img)
+            self._cache.move_to_end(key)
+            self.stats['loads'] += 1
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return template_img
+
+    def preload(self, language):
+        """Loads every PNG template of a language folder in both variants."""
+        folder = os.path.join(self.resources_dir, language)
+        if not os.path.isdir(folder):
+            logging.warning(f"Cannot preload templates, folder not found: {folder}"); return 0
+        count = 0
+        for filename in sorted(os.listdir(folder)):
+            if not filename.lower().endswith('.png'): continue
+            if self.get(language, filename) is not None and self.get(language, filename, grayscale=True) is not None:
+                count += 1
+        logging.info(f"Preloaded {count} template images for language '{language}'.")
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+class FeatureIndex:
+    """
+    Precomputed ORB keypoints and descriptors for the templates, keyed by a hash of the image content
+    and the ORB feature budget. The index is persisted per language in cache/orb_index_<language>.npz,
+    so feature-based matchers only have to compute the screen-side features.
+    """
+    # The feature budgets used by the matchers in ce_actions
+    NFEATURES = (500, 5000)
+
+    def __init__(self, store, cache_dir=CACHE_DIR):
+        self.store = store
+        self.cache_dir = cache_dir
+        self._entries = {} # "<sha1>_<nfeatures>" -> (points, descriptors)
+        self._loaded_languages = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _index_path(self, language):
+        return os.path.join(self.cache_dir, f"orb_index_{language}.npz")
+
+    @staticmethod
+    def _entry_key(template_img, nfeatures):
+        digest = hashlib.sha1(template_img.tobytes())
+        digest.update(str(template_img.shape).encode())
+        return f"{digest.hexdigest()}_{nfeatures}"
+
+    def load(self, language):
+        """Loads the persisted index of a language, if there is one."""
+        with self._lock:
+            if language in self._loaded_languages: return
+            self._loaded_languages.add(language)
+        index_path = self._index_path(language)
+        if not os.path.exists(index_path): return
+        try:
+            with np.load(index_path, allow_pickle=False) as data:
+                keys = {name.rsplit('_', 1)[0] for name in data.files}
+                entries = {key: (data[f"{key}_pts"], data[f"{key}_des"] if f"{key}_des" in data.files else None) for key in keys}
+        except Exception as e:
+            logging.warning(f"Could not load ORB descriptor index '{index_path}': {e}. It will be rebuilt."); return
+        with self._lock:
+            for key, value in entries.items(): self._entries.setdefault(key, value)
+        logging.info(f"Loaded {len(entries)} ORB descriptor entries from '{index_path}'.")
+
+    def save(self, language):
+        """Writes the entries for the templates of a language folder to disk."""
+        folder = os.path.join(self.store.resources_dir, language)
+        if not os.path.isdir(folder): return
+        arrays = {}
+        for filename in sorted(os.listdir(folder)):
+            if not filename.lower().endswith('.png'): continue
+            template_img = self.store.get(language, filename, grayscale=True)
+            if template_img is None: continue
+            for nfeatures in self.NFEATURES:
+                key = self._entry_key(template_img, nfeatures)
+                entry = self._entries.get(key)
+                if entry is None: continue
+                arrays[f"{key}_pts"] = entry[0]
+                if entry[1] is not None: arrays[f"{key}_des"] = entry[1]
+        index_path = self._index_path(language)
+        # Parallel workers share the file, so each one writes its own temporary file and swaps it in
+        temp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'wb') as f: # A file object keeps np.savez from appending '.npz' to the name
+                np.savez(f, **arrays)
+            os.replace(temp_path, index_path)
+            logging.debug(f"Saved ORB descriptor index to '{index_path}'.")
+        except OSError as e:
+            logging.warning(f"Could not save ORB descriptor index '{index_path}': {e}")
+
+    def get(self, language, image_name, nfeatures=500):
+        """
+        Returns (points, descriptors) for a template, where points is an Nx2 float32 array of keypoint
+        locations and descriptors is None if the template has no features.
+        Returns None if the template image is missing or unreadable.
+        """
+        template_img = self.store.get(language, image_name, grayscale=True)
+        if template_img is None: return None
+        self.load(language)
+        key = self._entry_key(template_img, nfeatures)
+        entry = self._entries.get(key)
+        if entry is None:
+            orb = cv2.ORB_create(nfeatures=nfeatures)
+            keypoints, descriptors = orb.detectAndCompute(template_img, None)
+            points = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2)
+            entry = (points, descriptors)
+            with self._lock:
+                self._entries[key] = entry
+                self._dirty = True
+        return entry
+
+    def build(self, language):
+        """Computes missing entries for every template of a language folder and persists the index."""
+        self.load(language)
+        folder = os.path.join(self.store.resources_dir, language)
+        if not os.path.isdir(folder): return
+        for filename in sorted(os.listdir(folder)):
+            if not filename.lower().endswith('.png'): continue
+            for nfeatures in self.NFEATURES:
+                self.get(language, filename, nfeatures)
+        if self._dirty:
+            self.save(language)
+            with self._lock: self._dirty = False
+
+    def save_all(self):
+        """Persists entries computed lazily since the last build."""
+        if not self._dirty: return
+        for language in sorted(self._loaded_languages):
+            self.save(language)
+        self._dirty = False
+
+TEMPLATES = TemplateStore(max_entries=load_general_config().get('template_cache_size', 256))
+FEATURES = FeatureIndex(TEMPLATES)
+atexit.register(FEATURES.save_all)
+
+def preload(language):
+    """Loads the templates of a language folder and their ORB descriptor index, building it if needed."""
+    TEMPLATES.preload(language)
+    FEATURES.build(language)
@@ -1,12 +1,18 @@
 import argparse
+import multiprocessing
 import os
 import sys
 import time
+# Taken before the project imports below, so the startup report includes them
+STARTUP_BEGIN = time.perf_counter()
 import logging
 import subprocess
 from ce_config import load_instances, connect_adb_to_instance
 import ce_actions
 import ce_interactive
+import ce_templates
+import ce_backends
+from ce_screens import SCREENS
 from ce_workflow_engine import WorkflowEngine
 
 # --- CONFIGURATION ---
@@ -45,7 +51,8 @@ def print_menu():
         "8": "Select Region by Dragging on Window",
         "9": "Get Coordinates from Image (Anchor Finding)",
         "10": "Get Coords from Features (Animated Anchor)", # <-- NEW
-        "11": "Run a Test Scenario" # <-- RENUMBERED
+        "11": "Run a Test Scenario", # <-- RENUMBERED
+        "12": "Identify Current Screen / Save as Reference Screenshot"
     }
     print("\n" + "="*50)
     print("      Clone Evolution Interactive Tester")
@@ -62,6 +69,7 @@ def main(adb_id, language, instance_name):
 
     print(f"\nSuccessfully connected to instance '{instance_name}' (device: {adb_id})")
     print(f"Using language for resources: '{language}'")
+    ce_templates.preload(language)
     
     while True:
         print_menu()
@@ -142,6 +150,16 @@ def main(adb_id, language, instance_name):
                 engine.run_workflow(scenario_to_run)
                 print(f"--- Scenario Finished: {scenario_to_run} ---")
             
+            elif choice == '12':
+                ce_actions.invalidate_frame(adb_id)
+                screen_name = ce_actions.current_screen(adb_id, language)
+                print(f"\n--- RESULT ---\nCurrent screen: {screen_name}\nKnown screens: {', '.join(SCREENS.screen_names(language)) or 'none'}\n--------------")
+                new_name = input("Enter a screen name to save this screenshot as its reference (leave empty to skip): ").strip()
+                if new_name:
+                    color_img, _ = ce_actions.get_frame(adb_id)
+                    if color_img is None: print("ERROR: Could not capture the screen."); continue
+                    print(f"Saved reference screenshot to {SCREENS.save_reference(language, new_name, color_img)}")
+
             elif choice == 'exit':
                 print("Exiting tester.")
                 break
@@ -153,11 +171,14 @@ def main(adb_id, language, instance_name):
             print(f"\nAn error occurred: {e}")
 
 if __name__ == "__main__":
+    # In the frozen CE_Tester.exe the OCR service child process starts here and must not run the menu
+    multiprocessing.freeze_support()
     # ... (This startup logic is unchanged) ...
     parser = argparse.ArgumentParser(description="Interactive tester for Clone Evolution automation actions.", formatter_class=argparse.RawTextHelpFormatter, usage="python %(prog)s [instance_name]")
     parser.add_argument("instance_name", nargs='?', default=None, help="The instance name from instances.ini (e.g., 'Adidas').")
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.info(ce_backends.startup_report(STARTUP_BEGIN))
     instance_name_to_use = args.instance_name or DEFAULT_INSTANCE_NAME
     if not instance_name_to_use: print("\nERROR: Instance name is not set."); sys.exit(1)
     print(f"Using instance: '{instance_name_to_use}'")
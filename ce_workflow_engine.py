@@ -1,15 +1,35 @@
-import yaml
 import logging
 import os
 import time
+from collections import ChainMap
+from functools import lru_cache
 from jinja2 import Template, Environment
 import ce_actions
+from ce_config import load_general_config
+from ce_workflows import WORKFLOWS, workflow_path
 from datetime import datetime
 
 # Setup a Jinja2 environment that includes the 'len' function
 jinja_env = Environment()
 jinja_env.globals['len'] = len
 
+BATCH_CLICKS = load_general_config().get('batch_clicks', True)
+CONDITION_GLOBALS = {'__builtins__': None, 'len': len}
+
+# Templates and expressions are compiled once per distinct source text. Workflow files contain a
+# bounded set of strings, so the caches stay small while loops re-use the compiled objects.
+@lru_cache(maxsize=2048)
+def _compile_template(source):
+    return jinja_env.from_string(source)
+
+@lru_cache(maxsize=4096)
+def _compile_expression(source):
+    """Returns the compiled code of a Python expression, or None if the text is not a valid expression."""
+    try:
+        return compile(source, '<workflow>', 'eval')
+    except (SyntaxError, ValueError):
+        return None
+
 class WorkflowEngine:
     def __init__(self, adb_id, language, instance_name, workflow_file=None):
         self.adb_id = adb_id
@@ -18,7 +38,7 @@ class WorkflowEngine:
         self.workflow_file = workflow_file
         self.actions = {
             'click': lambda args: ce_actions.click(self.adb_id, *args),
-            'delay': lambda args: time.sleep(args),
+            'delay': lambda args: self._delay(args),
             'scroll': lambda args: ce_actions.scroll(self.adb_id, *args),
             'send_email': lambda args: ce_actions.send_email(
                 subject=f"CE Automation Notification - {datetime.now().strftime('%Y-%m-%d')}",
@@ -34,20 +54,70 @@ class WorkflowEngine:
             'compare_with_text_easyocr': lambda *args: ce_actions.compare_with_text_easyocr(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
             'compare_with_features': lambda *args: ce_actions.compare_with_features(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
             'get_coords_from_image': lambda *args: ce_actions.get_coords_from_image(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
+            'get_coords_from_images': lambda *args: ce_actions.get_coords_from_images(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
+            'get_first_coords_from_images': lambda *args: ce_actions.get_first_coords_from_images(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
+            'wait_for_image': lambda *args: ce_actions.wait_for_image(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
+            'wait_for_any_image': lambda *args: ce_actions.wait_for_any_image(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
             'get_all_coords_from_image': lambda *args: ce_actions.get_all_coords_from_image(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
             'get_coords_from_features': lambda *args: ce_actions.get_coords_from_features(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
             'get_all_coords_from_features': lambda *args: ce_actions.get_all_coords_from_features(self.adb_id, self.language, self.context.get('instance_name'), self.context.get('workflow_name'), *args),
+            'current_screen': lambda: ce_actions.current_screen(self.adb_id, self.language),
         }
+        # Layered views over the live dicts, so names are looked up without merging dicts on every step.
+        # Functions shadow context variables of the same name, as the old {**context, **functions} merge did.
+        self._render_extras = {}
+        self._condition_scope = ChainMap(self.conditional_actions, self.context)
+        self._render_scope = ChainMap(self._render_extras, self.conditional_actions, self.context, jinja_env.globals)
+
+    def _delay(self, seconds):
+        """Pauses the workflow. The screen may change meanwhile, so the cached frame is dropped."""
+        time.sleep(seconds)
+        ce_actions.invalidate_frame(self.adb_id)
+
+    def _wait_for(self, command, params):
+        """
+        Runs a wait_for_image / wait_for_any_image step. The optional 'set' key names the context
+        variable that receives the result, the same way 'set' stores the result of get_coords_from_image.
+        """
+        if not isinstance(params, dict):
+            logging.error(f"'{command}' expects a mapping with 'image' (or 'images'), 'timeout', 'interval', 'threshold' and 'set' keys."); return
+        target = params.get('images') if command == 'wait_for_any_image' else params.get('image')
+        if not target:
+            logging.error(f"'{command}' step has no {'images' if command == 'wait_for_any_image' else 'image'} to wait for."); return
+        result = self.conditional_actions[command](target, params.get('timeout', 30), params.get('interval'), params.get('threshold', 0.85))
+        if params.get('set'):
+            self.context[params['set']] = result
+            logging.debug(f"Context updated: {params['set']} set to {result}")
+
+    @staticmethod
+    def _literal_clicks(steps, start):
+        """
+        Returns the (x, y) points of the consecutive 'click' steps beginning at steps[start] whose
+        coordinates are plain numbers. Clicks with templates are left out, because their coordinates
+        may depend on what the screen shows after the previous click.
+        """
+        points = []
+        for step in steps[start:]:
+            if not isinstance(step, dict) or list(step.keys())[0] != 'click': break
+            params = step['click']
+            if not (isinstance(params, list) and len(params) == 2 and all(isinstance(v, (int, float)) for v in params)): break
+            points.append(tuple(params))
+        return points
 
     def _render_template_string(self, template_string):
         """Renders a single string using Jinja2, returning a string."""
         if not isinstance(template_string, str):
             return template_string
-        template = jinja_env.from_string(template_string)
-        full_context = {**self.context, **self.conditional_actions}
-        full_context['current_date'] = datetime.now().strftime("%Y-%m-%d")
-        
-        return template.render(full_context)
+        if '{{' not in template_string and '{%' not in template_string and '{#' not in template_string:
+            return template_string # Plain text renders to itself
+        template = _compile_template(template_string)
+        self._render_extras['current_date'] = datetime.now().strftime("%Y-%m-%d")
+        # shared=True makes Jinja read the layered scope directly instead of copying it into a new dict
+        render_context = template.new_context(self._render_scope, shared=True)
+        try:
+            return jinja_env.concat(template.root_render_func(render_context))
+        except Exception:
+            return jinja_env.handle_exception()
     
     def _render_params(self, params):
         """
@@ -55,9 +125,11 @@ class WorkflowEngine:
         """
         if isinstance(params, str):
             rendered_string = self._render_template_string(params)
+            code = _compile_expression(rendered_string)
+            if code is None: return rendered_string
             try:
-                return eval(rendered_string, {'__builtins__': {}}, {})
-            except (SyntaxError, TypeError, NameError):
+                return eval(code, {'__builtins__': {}}, {})
+            except (TypeError, NameError):
                 return rendered_string
         elif isinstance(params, list):
             return [self._render_params(item) for item in params]
@@ -70,9 +142,9 @@ class WorkflowEngine:
         """Evaluates a condition string to True or False."""
         logging.debug(f"Evaluating condition: {condition_str}")
         try:
-            eval_globals = {'__builtins__': None, 'len': len}
-            eval_locals = {**self.context, **self.conditional_actions}
-            return eval(condition_str, eval_globals, eval_locals)
+            code = _compile_expression(condition_str)
+            if code is None: code = compile(condition_str, '<workflow>', 'eval') # Raises the actual SyntaxError for the log
+            return eval(code, CONDITION_GLOBALS, self._condition_scope)
         except Exception as e:
             logging.error(f"Error evaluating condition '{condition_str}': {type(e).__name__}: {e}")
             return False
@@ -80,7 +152,10 @@ class WorkflowEngine:
     def _process_steps(self, steps):
         if steps is None: 
             logging.error("A 'then' or 'do' block in the workflow is empty."); return
-        for step in steps:
+        index = 0
+        while index < len(steps):
+            step = steps[index]
+            index += 1
             if not isinstance(step, dict): 
                 logging.error(f"Malformed step found in workflow: {step}"); continue
             
@@ -90,6 +165,13 @@ class WorkflowEngine:
             if raw_params is None and command not in ['if', 'while']:
                  logging.error(f"Malformed step: command '{command}' has no value."); continue
 
+            if command == 'click' and BATCH_CLICKS:
+                points = self._literal_clicks(steps, index - 1)
+                if len(points) > 1:
+                    ce_actions.click_many(self.adb_id, points)
+                    index += len(points) - 1
+                    continue
+
             if command in ['if', 'while']:
                 condition_result = self._evaluate_condition(raw_params['condition'])
                 if command == 'if':
@@ -116,6 +198,8 @@ class WorkflowEngine:
                     else:
                         self.context.update(rendered_params)
                         logging.debug(f"Context updated: {self.context}")
+                elif command in ['wait_for_image', 'wait_for_any_image']:
+                    self._wait_for(command, rendered_params)
                 elif command == 'increment':
                     self.context[raw_params] = self.context.get(raw_params, 0) + 1
                     logging.debug(f"Incremented '{raw_params}': {self.context[raw_params]}")
@@ -123,18 +207,11 @@ class WorkflowEngine:
                     logging.warning(f"Unknown command in workflow: {command}")
 
     def run_workflow(self, workflow_name):
-        if self.workflow_file:
-            yaml_path = self.workflow_file
-        else:
-            yaml_path = os.path.join("resources", self.language, "workflows.yaml")
-        
-        if not os.path.exists(yaml_path):
-            logging.error(f"Workflow file not found: {yaml_path}"); return
-        
-        with open(yaml_path, 'r') as f:
-            data = yaml.safe_load(f)
+        yaml_path = workflow_path(self.language, self.workflow_file)
+        scenarios = WORKFLOWS.scenarios(yaml_path)
+        if scenarios is None: return
         
-        target_scenario = next((s for s in data.get('scenarios', []) if s.get('name') == workflow_name), None)
+        target_scenario = scenarios.get(workflow_name)
         
         if not target_scenario:
             logging.error(f"Workflow '{workflow_name}' not found in {yaml_path}"); return
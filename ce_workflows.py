@@ -0,0 +1,84 @@
+import os
+import logging
+import threading
+import yaml
+from ce_templates import RESOURCES_DIR
+
+def workflow_path(language, workflow_file=None):
+    """Returns the YAML file to run workflows from: the custom file if one was given, else resources/<language>/workflows.yaml."""
+    return workflow_file if workflow_file else os.path.join(RESOURCES_DIR, language, "workflows.yaml")
+
+class WorkflowRegistry:
+    """
+    Process-wide cache of parsed workflow files. Each YAML file is parsed and validated once and
+    its scenarios are indexed by name. The file's modification time is checked on every lookup,
+    so an edited workflow file is picked up without restarting the script.
+    """
+    def __init__(self):
+        self._files = {} # absolute path -> (mtime, {scenario name: scenario})
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'loads': 0}
+
+    @staticmethod
+    def _index(yaml_path, data):
+        """Validates the parsed file and returns its scenarios by name, in file order."""
+        if not isinstance(data, dict) or not isinstance(data.get('scenarios'), list):
+            logging.error(f"Workflow file '{yaml_path}' has no 'scenarios' list.")
+            return None
+        index = {}
+        for position, scenario in enumerate(data['scenarios'], 1):
+            if not isinstance(scenario, dict) or not scenario.get('name'):
+                logging.warning(f"Scenario #{position} in '{yaml_path}' has no name. Ignoring it."); continue
+            name = scenario['name']
+            if name in index:
+                logging.warning(f"Scenario '{name}' is defined more than once in '{yaml_path}'. Using the first definition."); continue
+            steps = scenario.get('steps')
+            if not steps:
+                logging.warning(f"Scenario '{name}' in '{yaml_path}' has no steps.")
+            elif not isinstance(steps, list) or any(not isinstance(step, dict) or len(step) != 1 for step in steps):
+                logging.warning(f"Scenario '{name}' in '{yaml_path}' has malformed steps. Each step must be a single 'command: value' entry.")
+            index[name] = scenario
+        return index
+
+    def scenarios(self, yaml_path):
+        """
+        Returns {scenario name: scenario} for a workflow file, or None if the file is missing or cannot be parsed.
+        """
+        key = os.path.abspath(yaml_path)
+        try:
+            mtime = os.stat(key).st_mtime
+        except OSError:
+            logging.error(f"Workflow file not found: {yaml_path}")
+            return None
+        with self._lock:
+            cached = self._files.get(key)
+            if cached and cached[0] == mtime:
+                self.stats['hits'] += 1
+                return cached[1]
+        try:
+            with open(key, 'r') as f:
+                data = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            logging.error(f"Could not load/parse workflow file '{yaml_path}': {e}")
+            return None
+        index = self._index(yaml_path, data)
+        if index is None: return None
+        with self._lock:
+            if cached:
+                logging.info(f"Workflow file '{yaml_path}' changed on disk. Reloaded.")
+            self._files[key] = (mtime, index)
+            self.stats['loads'] += 1
+        logging.debug(f"Loaded {len(index)} scenarios from '{yaml_path}'.")
+        return index
+
+    def scenario_names(self, yaml_path):
+        """Returns the scenario names of a workflow file in file order, or None if it cannot be loaded."""
+        index = self.scenarios(yaml_path)
+        return list(index) if index is not None else None
+
+    def get(self, yaml_path, name):
+        """Returns one scenario by name, or None if the file or the scenario does not exist."""
+        index = self.scenarios(yaml_path)
+        return index.get(name) if index is not None else None
+
+WORKFLOWS = WorkflowRegistry()
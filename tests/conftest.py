@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The ce_* modules live in the repository root and read instances.ini from the working directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
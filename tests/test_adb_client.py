@@ -0,0 +1,236 @@
+import socket
+import struct
+import threading
+import time
+import pytest
+import ce_adb
+from ce_adb import AdbClient, AdbShell, AdbError, AdbShellError, AdbShellTimeout, AdbShellUnconfirmed
+
+SERIAL = "127.0.0.1:5555"
+SCREENCAP = bytes(range(256)) * 40 + b"\r\n\n" # Binary data must arrive unchanged
+
+class FakeAdbServer:
+    """
+    A small stand-in for the ADB server on a local port. It speaks enough of the protocol for
+    AdbClient: host requests, host:transport, exec:/shell: streams, sync: RECV and interactive shells.
+    """
+    def __init__(self, files=None, raw_shell=True, shell=True):
+        self.files = files or {}
+        self.raw_shell = raw_shell
+        self.shell = shell
+        self.requests = [] # Every request text, in order
+        self.raw_requests = [] # The same requests as sent on the wire, with the length prefix
+        self.shell_commands = [] # Every command batch an interactive shell received
+        self._shells = []
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+        self._connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._listener.close()
+        for conn in self._connections:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk: raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def _read_request(self, conn):
+        prefix = self._read(conn, 4)
+        request = self._read(conn, int(prefix, 16))
+        self.raw_requests.append(prefix + request)
+        self.requests.append(request.decode())
+        return request.decode()
+
+    @staticmethod
+    def _fail(conn, message):
+        conn.sendall(b"FAIL" + f"{len(message):04x}".encode() + message.encode())
+
+    def _serve(self, conn):
+        try:
+            with conn:
+                request = self._read_request(conn)
+                if request == "host:devices":
+                    body = f"{SERIAL}\tdevice\nemulator-5556\toffline\n"
+                    conn.sendall(b"OKAY" + f"{len(body):04x}".encode() + body.encode()); return
+                if request == "host:bogus":
+                    conn.sendall(b"WHAT"); return
+                if request != f"host:transport:{SERIAL}":
+                    self._fail(conn, f"device '{request.rsplit(':', 1)[-1]}' not found"); return
+                conn.sendall(b"OKAY")
+                service = self._read_request(conn)
+                if service == "exec:screencap -p":
+                    conn.sendall(b"OKAY" + SCREENCAP)
+                elif service.startswith("shell:") and service != "shell:":
+                    conn.sendall(b"OKAY" + f"ran {service[6:]}\n".encode())
+                elif service == "sync:":
+                    conn.sendall(b"OKAY"); self._sync(conn)
+                elif self.shell and (service == "shell,raw:" and self.raw_shell or service == "shell:"):
+                    conn.sendall(b"OKAY"); self._shell(conn, echo=service == "shell:")
+                else:
+                    self._fail(conn, f"unknown service '{service}'")
+        except (ConnectionError, OSError):
+            pass
+
+    def _sync(self, conn):
+        while True:
+            header = self._read(conn, 8)
+            command, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if command == b"QUIT": return
+            path = self._read(conn, length).decode()
+            assert command == b"RECV"
+            if path not in self.files:
+                message = b"No such file or directory"
+                conn.sendall(b"FAIL" + struct.pack("<I", len(message)) + message); continue
+            data = self.files[path]
+            for start in range(0, len(data), 1000): # Several DATA chunks, like the real server sends for big files
+                chunk = data[start:start + 1000]
+                conn.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+            conn.sendall(b"DONE" + struct.pack("<I", 0))
+
+    def drop_shells(self):
+        """Closes the open interactive shells, as when the emulator restarts."""
+        for conn in self._shells: conn.shutdown(socket.SHUT_RDWR)
+        self._shells.clear()
+
+    def _shell(self, conn, echo):
+        self._shells.append(conn)
+        for line in conn.makefile('rb'):
+            line = line.decode().rstrip("\n")
+            if echo: conn.sendall(f"{line}\r\n".encode()) # A terminal shell echoes the input
+            commands, marker = line.rsplit("; echo ", 1)
+            self.shell_commands.append(commands)
+            if commands == "crash": # The shell dies while running the command
+                conn.shutdown(socket.SHUT_RDWR); return
+            if commands == "hang": continue
+            conn.sendall(f"out:{commands}\r\n{marker}\r\n".encode())
+
+@pytest.fixture
+def server():
+    fake = FakeAdbServer(files={"/sdcard/shot.png": SCREENCAP * 3})
+    yield fake
+    fake.close()
+
+@pytest.fixture
+def client(server):
+    adb_client = AdbClient("127.0.0.1", server.port)
+    yield adb_client
+    adb_client.close()
+
+def test_requests_are_length_prefixed(server, client):
+    client.run_service(SERIAL, "shell:getprop")
+    assert server.raw_requests[:2] == [f"{len('host:transport:' + SERIAL):04x}host:transport:{SERIAL}".encode(), b"000dshell:getprop"]
+
+def test_host_query_reads_hex_block(client):
+    assert client.host_query("host:devices") == f"{SERIAL}\tdevice\nemulator-5556\toffline\n"
+
+def test_fail_reply_raises_with_server_message(client):
+    with pytest.raises(AdbError, match="device 'emulator-9999' not found"):
+        client.run_service("emulator-9999", "shell:ls")
+
+def test_unexpected_reply_raises(client):
+    with pytest.raises(AdbError, match="Unexpected ADB reply"):
+        client.host_query("host:bogus")
+
+def test_failed_service_raises(client):
+    with pytest.raises(AdbError, match="unknown service"):
+        client.run_service(SERIAL, "exec:")
+
+def test_exec_returns_binary_output_unchanged(client):
+    assert client.run_service(SERIAL, "exec:screencap -p") == SCREENCAP
+
+def test_pull_joins_data_chunks_and_reuses_session(server, client):
+    assert client.pull(SERIAL, "/sdcard/shot.png") == SCREENCAP * 3
+    assert client.pull(SERIAL, "/sdcard/shot.png") == SCREENCAP * 3
+    assert server.requests.count("sync:") == 1
+
+def test_pull_fail_raises_and_keeps_session(server, client):
+    with pytest.raises(AdbError, match="No such file or directory"):
+        client.pull(SERIAL, "/sdcard/missing.png")
+    assert client.pull(SERIAL, "/sdcard/shot.png") == SCREENCAP * 3
+    assert server.requests.count("sync:") == 1
+
+@pytest.fixture
+def shell_for(monkeypatch):
+    shells = []
+    def make(server):
+        monkeypatch.setattr(ce_adb, "ADB_TRANSPORT", "socket")
+        monkeypatch.setattr(ce_adb, "CLIENT", AdbClient("127.0.0.1", server.port))
+        shells.append(AdbShell(SERIAL))
+        return shells[-1]
+    yield make
+    for adb_shell in shells: adb_shell.close()
+
+def test_shell_returns_output_before_marker(server, shell_for):
+    adb_shell = shell_for(server)
+    assert adb_shell.run("input tap 1 2") == "out:input tap 1 2"
+    assert adb_shell.run("input tap 3 4; input tap 5 6") == "out:input tap 3 4; input tap 5 6"
+    assert server.requests.count("shell,raw:") == 1
+
+def test_terminal_shell_skips_echoed_command(shell_for):
+    fake = FakeAdbServer(raw_shell=False)
+    try:
+        adb_shell = shell_for(fake)
+        assert adb_shell.run("input tap 1 2") == "out:input tap 1 2"
+        assert fake.requests[-2:] == [f"host:transport:{SERIAL}", "shell:"]
+    finally:
+        fake.close()
+
+def test_shell_reopens_session_that_died_between_calls(server, shell_for):
+    adb_shell = shell_for(server)
+    assert adb_shell.run("input tap 1 2") == "out:input tap 1 2"
+    server.drop_shells()
+    deadline = time.monotonic() + 5
+    while adb_shell._is_alive() and time.monotonic() < deadline: time.sleep(0.01)
+    assert not adb_shell._is_alive()
+    assert adb_shell.run("input tap 3 4") == "out:input tap 3 4"
+    assert server.requests.count("shell,raw:") == 2
+    assert server.shell_commands == ["input tap 1 2", "input tap 3 4"]
+
+def test_written_batch_is_not_resent_when_shell_dies(server, shell_for):
+    # The command may already have run (a tap delivered), so sending it again could tap twice
+    adb_shell = shell_for(server)
+    with pytest.raises(AdbShellUnconfirmed):
+        adb_shell.run("crash")
+    assert server.shell_commands == ["crash"]
+    assert server.requests.count("shell,raw:") == 1
+    assert adb_shell.run("input tap 1 2") == "out:input tap 1 2"
+    assert server.requests.count("shell,raw:") == 2
+
+def test_shell_timeout_is_not_retried(server, shell_for):
+    adb_shell = shell_for(server)
+    with pytest.raises(AdbShellTimeout):
+        adb_shell.run("hang", timeout=0.5)
+    assert server.shell_commands == ["hang"]
+    assert server.requests.count("shell,raw:") == 1
+    assert adb_shell.run("input tap 1 2") == "out:input tap 1 2"
+
+def test_shell_error_when_session_cannot_be_opened(shell_for):
+    fake = FakeAdbServer(shell=False)
+    try:
+        adb_shell = shell_for(fake)
+        with pytest.raises(AdbShellError) as raised:
+            adb_shell.run("input tap 1 2")
+        assert not isinstance(raised.value, AdbShellUnconfirmed) # Nothing was written, so a fallback may send it
+        assert fake.requests.count("shell,raw:") == 2 # Opening is tried again once
+        assert fake.shell_commands == []
+    finally:
+        fake.close()
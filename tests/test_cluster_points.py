@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+import pytest
+import ce_actions
+from ce_actions import _cluster_points, _cluster_centers
+
+def reference_dbscan(points, eps, min_samples):
+    """scikit-learn's DBSCAN (brute-force neighbours + dbscan_inner), kept here since scikit-learn is no longer a dependency."""
+    points = np.asarray(points, dtype=np.float64)
+    distances = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    neighbours = [np.flatnonzero(row <= eps) for row in distances]
+    is_core = np.array([len(members) >= min_samples for members in neighbours], dtype=bool)
+    labels = np.full(len(points), -1, dtype=np.intp)
+    label = 0
+    for i in range(len(points)):
+        if labels[i] != -1 or not is_core[i]: continue
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            if labels[j] != -1: continue
+            labels[j] = label
+            if is_core[j]: stack.extend(v for v in neighbours[j] if labels[v] == -1)
+        label += 1
+    return labels
+
+SQUARE = [(0, 0), (10, 0), (0, 10), (10, 10), (5, 5)]
+
+def shifted(points, dx, dy):
+    return [(x + dx, y + dy) for x, y in points]
+
+def test_two_clusters_and_noise():
+    points = np.float32(shifted(SQUARE, 100, 100) + [(300, 300)] + shifted(SQUARE, 500, 300))
+    labels = _cluster_points(points, eps=20, min_samples=5)
+    assert labels.tolist() == [0] * 5 + [-1] + [1] * 5
+    assert _cluster_centers(points, labels) == [(105, 105), (505, 305)]
+
+def test_distance_equal_to_eps_is_a_neighbour():
+    points = np.float32([(0, 0), (10, 0)])
+    assert _cluster_points(points, eps=10, min_samples=2).tolist() == [0, 0]
+    assert _cluster_points(points, eps=9.99, min_samples=2).tolist() == [-1, -1]
+
+def test_point_counts_as_its_own_neighbour():
+    points = np.float32([(0, 0), (3, 0), (0, 3)])
+    assert _cluster_points(points, eps=5, min_samples=3).tolist() == [0, 0, 0]
+    assert _cluster_points(points, eps=5, min_samples=4).tolist() == [-1, -1, -1]
+    assert _cluster_points(points, eps=5, min_samples=1).tolist() == [0, 0, 0]
+
+def test_isolated_points_with_min_samples_one_are_own_clusters():
+    points = np.float32([(0, 0), (100, 0), (0, 100)])
+    assert _cluster_points(points, eps=5, min_samples=1).tolist() == [0, 1, 2]
+
+def test_chain_is_one_cluster_with_border_ends():
+    # Interior points have 3 neighbours (core), the two ends only 2 (border)
+    points = np.float32([(x, 0) for x in range(0, 101, 10)])
+    labels = _cluster_points(points, eps=10, min_samples=3)
+    assert labels.tolist() == [0] * 11
+    assert _cluster_centers(points, labels) == [(50, 0)]
+
+def test_gap_splits_chain():
+    points = np.float32([(x, 0) for x in range(0, 101, 10) if x != 50])
+    labels = _cluster_points(points, eps=10, min_samples=3)
+    assert labels.tolist() == [0] * 5 + [1] * 5
+    assert _cluster_centers(points, labels) == [(20, 0), (80, 0)]
+
+def test_shared_border_point_goes_to_first_cluster():
+    # (20, 0) is within eps of a core point of both clusters but is not a core point itself.
+    # Clusters are grown in index order, so it joins the cluster of the first points (label 0).
+    right = [(40, 0), (45, 0), (40, 5), (40, -5)]
+    left = [(0, 0), (-5, 0), (0, 5), (0, -5)]
+    points = np.float32(right + left + [(20, 0)])
+    labels = _cluster_points(points, eps=20, min_samples=4)
+    assert labels.tolist() == [0] * 4 + [1] * 4 + [0]
+    assert labels.tolist() == reference_dbscan(points, 20, 4).tolist()
+
+def test_all_noise_has_no_centers():
+    points = np.float32([(0, 0), (50, 50), (100, 100)])
+    labels = _cluster_points(points, eps=10, min_samples=2)
+    assert labels.tolist() == [-1, -1, -1]
+    assert _cluster_centers(points, labels) == []
+
+def test_unsorted_input_keeps_point_order():
+    points = np.float32([(500, 0), (0, 0), (505, 0), (5, 0), (0, 5), (500, 5)])
+    assert _cluster_points(points, eps=10, min_samples=3).tolist() == [0, 1, 0, 1, 1, 0]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 256])
+def test_chunk_size_does_not_change_labels(chunk_size):
+    points = np.float32(shifted(SQUARE, 100, 100) + [(300, 300)] + shifted(SQUARE, 500, 300) + [(x, 0) for x in range(0, 101, 10)])
+    assert _cluster_points(points, 20, 5, chunk_size).tolist() == _cluster_points(points, 20, 5).tolist()
+
+def test_matches_reference_on_random_feature_clouds():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        cluster_count, point_count = rng.integers(1, 8), rng.integers(5, 300)
+        cluster_centers = rng.uniform(0, 1600, (cluster_count, 2))
+        points = (cluster_centers[rng.integers(0, cluster_count, point_count)] + rng.normal(0, rng.uniform(5, 60), (point_count, 2))).astype(np.float32)
+        eps, min_samples = float(rng.integers(10, 80)), int(rng.integers(2, 10))
+        expected = reference_dbscan(points, eps, min_samples)
+        assert _cluster_points(points, eps, min_samples, chunk_size=int(rng.integers(7, 300))).tolist() == expected.tolist()
+
+def test_matches_scikit_learn_when_installed():
+    cluster = pytest.importorskip("sklearn.cluster")
+    rng = np.random.default_rng(1)
+    points = (rng.uniform(0, 1600, (5, 2))[rng.integers(0, 5, 400)] + rng.normal(0, 25, (400, 2))).astype(np.float32)
+    expected = cluster.DBSCAN(eps=40, min_samples=5).fit(points).labels_
+    assert _cluster_points(points, 40, 5).tolist() == expected.tolist()
+
+# Real ORB keypoints: the screen points of the good matches (ORB, nfeatures=5000 for the template, ratio 0.8)
+# of a template on tests/fixtures/frame_en.png, a frame made of real templates from resources/en.
+# The labels and centres were recorded with scikit-learn 1.9.1 DBSCAN(eps=50, min_samples=5).
+REAL_CLUSTERS = [
+    ("golden_chest.png", "tests/fixtures/orb_points_golden_chest.npz", [(156, 173), (375, 185)]), # Two chests and noise
+    ("gch2.png", "tests/fixtures/orb_points_gch2.npz", [(712, 184)]), # A similar chest, gch1.png
+]
+
+@pytest.mark.parametrize("image_name, fixture, expected", REAL_CLUSTERS)
+def test_matches_scikit_learn_on_real_orb_points(image_name, fixture, expected):
+    recorded = np.load(fixture)
+    labels = _cluster_points(recorded["points"], 50, 5)
+    assert labels.tolist() == recorded["labels"].tolist()
+    assert sorted(_cluster_centers(recorded["points"], labels), key=lambda p: (p[1], p[0])) == expected
+
+@pytest.mark.parametrize("image_name, fixture, expected", REAL_CLUSTERS)
+def test_get_all_coords_from_features_on_real_frame(monkeypatch, image_name, fixture, expected):
+    frame = cv2.imread("tests/fixtures/frame_en.png")
+    monkeypatch.setattr(ce_actions, "get_frame", lambda adb_id: (frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+    monkeypatch.setattr(ce_actions, "SAVE_DEBUG_IMAGES", False)
+    monkeypatch.setattr(ce_actions, "FEATURE_MATCHER", "bf")
+    assert ce_actions.get_all_coords_from_features("adb", "en", "test", "test", image_name) == expected
@@ -0,0 +1,138 @@
+import cv2
+import numpy as np
+import pytest
+import ce_actions
+from ce_actions import _match_peaks
+
+W, H = 20, 20 # Template size: matches closer than (W + H) / 4 = 10 px are grouped
+
+def group_rectangles(res, threshold, template_w, template_h):
+    """
+    The matches the old code found: every passing pixel as a rectangle, grouped by cv2.groupRectangles(rects, 1, 0.5).
+    Some OpenCV builds lack groupRectangles, so a port of it (partition by SimilarRects, average each group,
+    drop groups of one rectangle) is used there.
+    """
+    ys, xs = np.nonzero(res >= threshold)
+    rects = [[int(x), int(y), template_w, template_h] for x, y in zip(xs, ys)]
+    if not rects: return []
+    if hasattr(cv2, 'groupRectangles'):
+        grouped, _ = cv2.groupRectangles(rects, 1, 0.5)
+        return sorted(tuple(int(v) for v in r) for r in grouped)
+    delta = 0.5 * (template_w + template_h) * 0.5
+    points = np.array([r[:2] for r in rects])
+    parent = list(range(len(points)))
+    def find(a):
+        while parent[a] != a: a = parent[a]
+        return a
+    for i in range(len(points)):
+        close = np.flatnonzero((np.abs(points[i + 1:, 0] - points[i, 0]) <= delta) & (np.abs(points[i + 1:, 1] - points[i, 1]) <= delta)) + i + 1
+        for j in close: parent[find(j)] = find(i)
+    groups = {}
+    for i in range(len(points)): groups.setdefault(find(i), []).append(i)
+    return sorted((int(np.rint(points[g, 0].mean())), int(np.rint(points[g, 1].mean())), template_w, template_h)
+                  for g in groups.values() if len(g) > 1)
+
+def response(size=(120, 200)):
+    return np.zeros(size, dtype=np.float32)
+
+def test_empty_response_has_no_matches():
+    assert _match_peaks(response(), 0.8, W, H) == []
+
+def test_isolated_pixel_is_dropped():
+    # groupRectangles(groupThreshold=1) drops groups of a single rectangle
+    res = response()
+    res[40, 50] = 0.99
+    assert _match_peaks(res, 0.8, W, H) == []
+    assert group_rectangles(res, 0.8, W, H) == []
+
+def test_two_pixels_make_a_match_at_their_mean():
+    res = response()
+    res[40, 50], res[40, 52] = 0.95, 0.9
+    assert _match_peaks(res, 0.8, W, H) == [(51, 40, W, H)]
+    assert group_rectangles(res, 0.8, W, H) == [(51, 40, W, H)]
+
+def test_threshold_is_inclusive():
+    res = response()
+    res[40, 50:52] = 0.8
+    assert _match_peaks(res, 0.8, W, H) == [(50, 40, W, H)] # mean 50.5 rounds to even
+    assert _match_peaks(res, 0.81, W, H) == []
+
+def test_blob_is_placed_at_mean_of_passing_pixels():
+    res = response()
+    res[40:43, 50:53] = 0.85
+    res[40, 50] = 0.95 # The peak is in a corner, the match is still at the middle of the blob
+    assert _match_peaks(res, 0.8, W, H) == [(51, 41, W, H)]
+    assert group_rectangles(res, 0.8, W, H) == [(51, 41, W, H)]
+
+def test_chained_neighbours_are_one_match():
+    # A diagonal chain of pixels, each touching the next, with its strongest pixel at one end
+    res = response()
+    for step in range(6):
+        res[40 + step, 50 + step] = 0.95 - 0.01 * step
+    assert _match_peaks(res, 0.8, W, H) == [(52, 42, W, H)] # mean 52.5 rounds to even
+    assert _match_peaks(res, 0.8, W, H) == group_rectangles(res, 0.8, W, H)
+
+def test_ridge_longer_than_grouping_distance_is_centred_on_its_peak():
+    # groupRectangles merges a chain transitively and averages all of it (x = 35);
+    # _match_peaks only averages the passing pixels within the grouping distance of the peak
+    res = response()
+    res[40, 10:61] = np.linspace(0.85, 0.95, 51)
+    assert _match_peaks(res, 0.8, W, H) == [(55, 40, W, H)]
+    assert group_rectangles(res, 0.8, W, H) == [(35, 40, W, H)]
+
+def test_matches_further_apart_than_grouping_distance_are_kept():
+    res = response()
+    res[40, 50:52] = 0.9
+    res[40, 62:64] = 0.9 # 12 px to the right: more than 10 px apart
+    res[80, 150:152] = 0.9
+    assert sorted(_match_peaks(res, 0.8, W, H)) == [(50, 40, W, H), (62, 40, W, H), (150, 80, W, H)]
+
+def test_weaker_match_within_grouping_distance_is_suppressed():
+    res = response()
+    res[40, 50:52] = 0.95
+    res[45, 58:60] = 0.85 # A separate local maximum, but within 10 px of the stronger one in x and y
+    # One match, placed at the mean of all four passing pixels, like groupRectangles averages its group
+    assert _match_peaks(res, 0.8, W, H) == [(54, 42, W, H)]
+    assert group_rectangles(res, 0.8, W, H) == [(54, 42, W, H)]
+
+def test_nan_is_ignored():
+    res = response()
+    res[40, 50:52] = 0.9
+    res[10, 10:13] = np.nan
+    assert _match_peaks(res, 0.8, W, H) == [(50, 40, W, H)]
+
+@pytest.mark.parametrize("seed", range(30))
+def test_same_matches_as_group_rectangles_on_compact_blobs(seed):
+    # Real matches show up as small blobs in the response map, with the strongest value near the middle.
+    # Each blob gets its own 40 px cell, so no two are within the grouping distance of each other.
+    rng = np.random.default_rng(seed)
+    res = (rng.random((280, 480)) * 0.5).astype(np.float32)
+    cells = rng.choice(7 * 12, size=rng.integers(1, 10), replace=False)
+    for cell in cells:
+        y, x = 20 + 40 * (cell // 12) + rng.integers(-5, 6), 20 + 40 * (cell % 12) + rng.integers(-5, 6)
+        radius = rng.integers(1, 3)
+        yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        blob = 0.95 - 0.03 * np.hypot(yy, xx) + rng.uniform(-0.005, 0.005, yy.shape)
+        area = res[y - radius:y + radius + 1, x - radius:x + radius + 1]
+        np.maximum(area, blob.astype(np.float32), out=area)
+    expected = group_rectangles(res, 0.85, W, H)
+    assert len(expected) == len(cells)
+    assert sorted(_match_peaks(res, 0.85, W, H)) == expected
+
+# A 1280x720 frame made of real templates from resources/en (three Sweep buttons in a list, golden chests,
+# a similar chest and other buttons as distractors). The expected centres are what get_all_coords_from_image
+# returned on it before _match_peaks, with matchTemplate + cv2.groupRectangles (OpenCV 4.14).
+FRAME = cv2.imread("tests/fixtures/frame_en.png")
+
+@pytest.mark.parametrize("image_name, threshold, expected", [
+    ("Sweep.png", 0.85, [(1113, 205), (1113, 325), (1113, 445)]),
+    ("Sweep_purple.png", 0.85, [(1111, 624)]),
+    ("golden_chest.png", 0.85, []), # Only the exact pixel passes, and groupRectangles dropped single rectangles
+    ("golden_chest.png", 0.7, [(156, 178), (376, 188)]), # The smaller third chest scores below 0.7
+    ("red_x.png", 0.85, [(1230, 48)]),
+    ("Guild.png", 0.85, [(288, 581)]),
+])
+def test_same_coords_as_baseline_on_real_frame(monkeypatch, image_name, threshold, expected):
+    monkeypatch.setattr(ce_actions, "get_frame", lambda adb_id: (FRAME, cv2.cvtColor(FRAME, cv2.COLOR_BGR2GRAY)))
+    monkeypatch.setattr(ce_actions, "SAVE_DEBUG_IMAGES", False)
+    assert ce_actions.get_all_coords_from_image("adb", "en", "test", "test", image_name, threshold, False) == expected
@@ -0,0 +1,94 @@
+import itertools
+import threading
+import time
+import types
+import ce_notify
+from ce_notify import Notifier, FileBackend
+
+class RecordingBackend:
+    name = 'recording'
+
+    def __init__(self, failures=0):
+        self.sent = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def send(self, recipient, subject, body):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise OSError("server busy")
+            self.sent.append((recipient, subject, body))
+
+def test_messages_are_sent_in_order():
+    backend = RecordingBackend()
+    notifier = Notifier(backend, 'me@example.com')
+    notifier.notify('one', 'first')
+    notifier.notify('two', 'second')
+    assert notifier.flush(5)
+    assert backend.sent == [('me@example.com', 'one', 'first'), ('me@example.com', 'two', 'second')]
+
+def test_failed_send_is_retried():
+    backend = RecordingBackend(failures=2)
+    notifier = Notifier(backend, 'me@example.com', retries=3, retry_delay=0.01)
+    notifier.notify('one', 'first')
+    assert notifier.flush(5)
+    assert [subject for _, subject, _ in backend.sent] == ['one']
+    assert notifier.stats == {'queued': 1, 'sent': 1, 'failed': 0}
+
+def test_gives_up_after_retries():
+    backend = RecordingBackend(failures=5)
+    notifier = Notifier(backend, 'me@example.com', retries=2, retry_delay=0.01)
+    notifier.notify('one', 'first')
+    assert notifier.flush(5)
+    assert backend.sent == []
+    assert notifier.stats['failed'] == 1
+
+def test_run_digest_is_sent_on_flush():
+    backend = RecordingBackend()
+    notifier = Notifier(backend, 'me@example.com', digest='run')
+    for i in range(3): notifier.notify(f"message {i}", "body")
+    time.sleep(0.2)
+    assert backend.sent == []
+    assert notifier.flush(5)
+    assert len(backend.sent) == 1
+    _, subject, body = backend.sent[0]
+    assert subject == "CE Automation: 3 notifications"
+    assert all(f"message {i}" in body for i in range(3))
+
+def test_urgent_message_sends_pending_digest_at_once():
+    backend = RecordingBackend()
+    notifier = Notifier(backend, 'me@example.com', digest='window', digest_window=60)
+    notifier.notify('waiting', 'body')
+    notifier.notify('stop', 'body', urgent=True)
+    deadline = time.monotonic() + 5
+    while not backend.sent and time.monotonic() < deadline: time.sleep(0.01)
+    assert [subject for _, subject, _ in backend.sent] == ["CE Automation: 2 notifications"]
+
+def test_window_closes_while_messages_keep_arriving(monkeypatch):
+    # The queue is never empty when the window ends, so waiting for the queue never times out
+    release = threading.Event()
+    class BlockingBackend(RecordingBackend):
+        def send(self, recipient, subject, body):
+            if subject == 'hold': release.wait(5) # Keeps the worker busy while the queue fills up
+            super().send(recipient, subject, body)
+    clock = itertools.count(step=10) # Every clock reading is 10 s after the previous one
+    monkeypatch.setattr(ce_notify, 'time', types.SimpleNamespace(monotonic=lambda: next(clock), perf_counter=time.perf_counter, sleep=time.sleep))
+    backend = BlockingBackend()
+    notifier = Notifier(backend, 'me@example.com', digest='window', digest_window=5)
+    notifier.notify('hold', 'body', urgent=True)
+    for i in range(5): notifier.notify(f"message {i}", 'body')
+    release.set()
+    assert notifier.flush(5)
+    # Each message arrives after the window of the previous one has ended, so none are merged
+    assert [subject for _, subject, _ in backend.sent] == ['hold'] + [f"message {i}" for i in range(5)]
+
+def test_file_backend_appends_messages(tmp_path):
+    path = tmp_path / "logs" / "notifications.log"
+    notifier = Notifier(FileBackend(str(path)), 'me@example.com')
+    notifier.notify('one', 'first')
+    notifier.notify('two', 'second')
+    assert notifier.flush(5)
+    text = path.read_text(encoding='utf-8')
+    assert "To: me@example.com | one\nfirst" in text
+    assert "To: me@example.com | two\nsecond" in text